@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+
+import os, random
+
+from argparse      import ArgumentParser
+
+from labtool.parse import DUAL_FIELDS, FIELD_MAPPING, KNOWN_UNITS, STANDALONE_FIELDS, REGULAR_FIELD_KEYS
+
+
+PAGE_WIDTH  = 595
+PAGE_HEIGHT = 842
+FONT_SIZE   = 8
+
+COLUMN_NAME     = 40
+COLUMN_VALUE    = 330
+COLUMN_UNIT     = 390
+COLUMN_REFVALUE = 450
+
+HEADER_TOP    = 800
+HEADER_HEIGHT = 12
+ROW_HEIGHT    = 10
+PAGE_BOTTOM   = 40
+
+
+def escape_pdf_string(text):
+	return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(pages):
+	objects = []
+
+	def add_object(data):
+		objects.append(data)
+		return len(objects)
+
+	font = add_object(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+	pages_id = len(objects) + 2 * len(pages) + 1
+
+	kids = []
+	for lines in pages:
+		stream = '\n'.join(f'BT /F1 {FONT_SIZE} Tf {x} {y} Td ({escape_pdf_string(text)}) Tj ET' for x, y, text in lines)
+		stream = stream.encode('cp1252')
+		contents = add_object(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+		kids.append(add_object(b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+		                       b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+		                       % (pages_id, PAGE_WIDTH, PAGE_HEIGHT, font, contents)))
+
+	add_object(b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % k for k in kids), len(kids)))
+	catalog = add_object(b'<< /Type /Catalog /Pages %d 0 R >>' % pages_id)
+
+	pdf = bytearray(b'%PDF-1.4\n')
+	offsets = []
+	for n, data in enumerate(objects, 1):
+		offsets.append(len(pdf))
+		pdf += b'%d 0 obj\n%s\nendobj\n' % (n, data)
+
+	xref = len(pdf)
+	pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+	for offset in offsets:
+		pdf += b'%010d 00000 n \n' % offset
+	pdf += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, catalog, xref)
+
+	return bytes(pdf)
+
+
+def make_header(rng, request):
+	values = {
+		'CIP': f'XXXX{rng.randrange(10**9):09d}',
+		'Data obtencio mostra': f'{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2015, 2023)}',
+		'Data recepcio mostra': f'{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2015, 2023)}',
+		'Edat': str(rng.randint(18, 99)),
+		'Localitzacio': f'Planta {rng.randint(1, 9)}',
+		'Metge': 'Metge Sintetic',
+		'N Laboratori': str(request),
+		'NHC': str(rng.randrange(10**5, 10**7)),
+		'Observacions': 'Cap',
+		'Pacient': 'Pacient Sintetic',
+		'Procedencia': 'Hospital Sintetic',
+		'Servei': 'Medicina Interna',
+		'Sexe': rng.choice(['Home', 'Dona']),
+		'Unitat de tractament': 'UT1',
+	}
+	return [f'{name}: {values[name]}' for name in STANDALONE_FIELDS]
+
+
+def make_value(rng):
+	value = f'{rng.uniform(0, 200):.1f}'
+	return rng.choice([value, value, value, f'* {value}', f'<{rng.randint(1, 10)}', 'Pendent'])
+
+
+def make_refvalue(rng):
+	low = round(rng.uniform(0, 50), 1)
+	return rng.choice([
+		f'[ {low} - {low + rng.randint(5, 100)} ]',
+		f'[ < {low} ]',
+		f'[ > {low} ]',
+		f'Valor desitjable < {low}',
+	])
+
+
+def make_comments(rng):
+	words = ['resultat', 'mostra', 'valor', 'control', 'revisat', 'pacient', 'interpretacio', 'recomanat', 'seguiment']
+	lines = []
+	for y in range(HEADER_TOP, PAGE_BOTTOM, -ROW_HEIGHT):
+		lines.append((COLUMN_NAME, y, ' '.join(rng.choice(words) for _ in range(12))))
+	return lines
+
+
+def make_report(seed=0, pages=2, fields=20, comments=0):
+	capacity = (HEADER_TOP - len(STANDALONE_FIELDS) * HEADER_HEIGHT - PAGE_BOTTOM) // ROW_HEIGHT - 1
+
+	rng = random.Random(seed)
+	layout = []
+	for _ in range(pages):
+		names = rng.sample(REGULAR_FIELD_KEYS, fields)
+		if len(names) + sum(FIELD_MAPPING[n] in DUAL_FIELDS for n in names) > capacity:
+			raise ValueError(f'{fields} fields do not fit in a page')
+
+		lines = []
+		y = HEADER_TOP
+		for text in make_header(rng, seed):
+			lines.append((COLUMN_NAME, y, text))
+			y -= HEADER_HEIGHT
+
+		y -= ROW_HEIGHT
+		for name in names:
+			lines.append((COLUMN_NAME, y, name))
+			lines.append((COLUMN_VALUE, y, make_value(rng)))
+			lines.append((COLUMN_UNIT, y, rng.choice(KNOWN_UNITS)))
+			lines.append((COLUMN_REFVALUE, y, make_refvalue(rng)))
+			y -= ROW_HEIGHT
+
+			if FIELD_MAPPING[name] in DUAL_FIELDS:
+				lines.append((COLUMN_VALUE, y, make_value(rng)))
+				lines.append((COLUMN_UNIT, y, rng.choice(KNOWN_UNITS)))
+				y -= ROW_HEIGHT
+
+		layout.append(lines)
+
+	for _ in range(comments):
+		layout.append(make_comments(rng))
+
+	return make_pdf(layout)
+
+
+def main():
+	parser = ArgumentParser(description='Generate synthetic lab report files.')
+	parser.add_argument('directory', help='directory to write reports to')
+	parser.add_argument('-n', '--reports', type=int, default=10, help='number of reports')
+	parser.add_argument('-p', '--pages', type=int, default=2, help='pages per report')
+	parser.add_argument('-F', '--fields', type=int, default=20, help='regular fields per page')
+	parser.add_argument('-C', '--comments', type=int, default=0, help='comment pages without fields per report')
+	parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the first report')
+	args = parser.parse_args()
+
+	os.makedirs(args.directory, exist_ok=True)
+	for seed in range(args.seed, args.seed + args.reports):
+		with open(os.path.join(args.directory, f'report-{seed:06d}.pdf'), 'wb') as f:
+			f.write(make_report(seed, args.pages, args.fields, args.comments))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+import gc, tracemalloc
+
+from argparse            import ArgumentParser
+from io                  import BytesIO
+
+from benchmarks.generate import make_report
+from labtool.parse       import assemble_regular_fields, classify_page_items, extract_page_items
+
+
+def parse_pages(pages):
+	data = {}
+	for items in pages:
+		standalone_fields, field_items, value_items = classify_page_items(items)
+		for field in standalone_fields + assemble_regular_fields(field_items, value_items):
+			data.setdefault(field.name, field)
+	return list(data.values())
+
+
+def main():
+	parser = ArgumentParser(description='Measure memory used by parsed report representations.')
+	parser.add_argument('-n', '--reports', type=int, default=50, help='number of reports')
+	parser.add_argument('-p', '--pages', type=int, default=2, help='pages per report')
+	parser.add_argument('-F', '--fields', type=int, default=40, help='regular fields per page')
+	args = parser.parse_args()
+
+	# Extraction happens up front so only the parsed representation is traced
+	extracted = [list(extract_page_items(BytesIO(make_report(seed, args.pages, args.fields))))
+	             for seed in range(args.reports)]
+
+	gc.collect()
+	tracemalloc.start()
+	records = [parse_pages(pages) for pages in extracted]
+	gc.collect()
+	retained, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	nfields = sum(len(data) for data in records)
+	print(f'{"retained":10s} {retained / len(records):10.0f} bytes/report {retained / nfields:8.0f} bytes/field')
+	print(f'{"peak":10s} {peak / len(records):10.0f} bytes/report')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+
+import random, re, timeit
+
+from argparse      import ArgumentParser
+
+from labtool.parse import FIELD_MAPPING, KNOWN_UNITS, STANDALONE_FIELDS, normalize_string
+
+
+def reference_normalize_string(s):
+	s = re.sub(r'[ \t]+', ' ', s)
+	s = re.sub(r' ([;\(])', r'\1', s)
+	s = re.sub(r'([.;\)]) ', r'\1', s)
+	s = re.sub(r'([-;\(\)])[\'"]', r'\1', s)
+	s = re.sub(r'[\'"]([-;\(\)])', r'\1', s)
+	s = s.replace('—', '-')
+	s = s.replace('à', 'a')
+	s = s.replace('ú', 'u')
+	s = re.sub('[`´]', "'", s)
+	s = re.sub('[èé]', 'e', s)
+	s = re.sub('[íï]', 'i', s)
+	s = re.sub('[òó]', 'o', s)
+	return s.strip()
+
+
+def make_lines(count, seed=0):
+	rng = random.Random(seed)
+	templates = list(FIELD_MAPPING) + [f'{f}: Valor' for f in STANDALONE_FIELDS] + KNOWN_UNITS
+	lines = []
+	for _ in range(count):
+		line = rng.choice(templates).replace(';', rng.choice([';', ' ; ', ';  ']))
+		lines.append(line.replace('o', rng.choice(['o', 'ó', 'ò'])))
+	return lines
+
+
+def measure(function, lines, repeat):
+	return min(timeit.repeat(lambda: [function(line) for line in lines], number=1, repeat=repeat)) / len(lines)
+
+
+def main():
+	parser = ArgumentParser(description='Compare per-line cost of normalize_string against the previous implementation.')
+	parser.add_argument('-n', '--lines', type=int, default=20000, help='number of lines to normalize')
+	parser.add_argument('-r', '--repeat', type=int, default=5, help='number of timing repetitions')
+	args = parser.parse_args()
+
+	lines = make_lines(args.lines)
+	for line in lines:
+		assert normalize_string(line) == reference_normalize_string(line)
+
+	reference = measure(reference_normalize_string, lines, args.repeat)
+	compiled = measure(normalize_string.__wrapped__, lines, args.repeat)
+	memoized = measure(normalize_string, lines, args.repeat)
+
+	print(f'{"reference":10s} {reference * 1e9:8.0f} ns/line')
+	print(f'{"compiled":10s} {compiled * 1e9:8.0f} ns/line  {reference / compiled:5.1f}x')
+	print(f'{"memoized":10s} {memoized * 1e9:8.0f} ns/line  {reference / memoized:5.1f}x')
+
+
+if __name__ == '__main__':
+	main()
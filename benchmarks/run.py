@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+import json, os, platform, subprocess, tempfile, time
+
+from argparse            import ArgumentParser
+from io                  import BytesIO, StringIO
+
+from benchmarks.generate import make_report
+from labtool.encoders    import encoder_requires_filename, encoders_available, open_sink
+from labtool.parse       import EXTRACTION_ENGINES, assemble_regular_fields, classify_page_items, extract_page_items, parse_lab
+
+
+def best_of(repeat, function):
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		function()
+		timings.append(time.perf_counter() - start)
+	return min(timings)
+
+
+def describe_fields(data):
+	return sorted((field.name, repr(field._data)) for field in data)
+
+
+def encode_records(name, records, directory):
+	target = StringIO()
+	if encoder_requires_filename(name):
+		target = os.path.join(directory, name)
+
+	with open_sink(name, target) as sink:
+		for data in records:
+			sink.write(data)
+
+
+def run_benchmarks(reports, repeat):
+	results = {}
+
+	pages = {}
+	for engine in EXTRACTION_ENGINES:
+		results[f'extract.{engine}'] = best_of(repeat, lambda: [list(extract_page_items(BytesIO(r), engine)) for r in reports])
+		pages[engine] = [list(extract_page_items(BytesIO(r), engine)) for r in reports]
+
+	results['extract.unfiltered'] = best_of(repeat, lambda: [list(extract_page_items(BytesIO(r), prefilter=False)) for r in reports])
+
+	records = {engine: [describe_fields(parse_lab(BytesIO(r), engine)) for r in reports] for engine in EXTRACTION_ENGINES}
+	for engine, described in records.items():
+		if described != records['default']:
+			raise AssertionError(f'engine "{engine}" does not produce the same fields as "default"')
+
+	page_items = [items for report in pages['default'] for items in report]
+	results['classify'] = best_of(repeat, lambda: [classify_page_items(items) for items in page_items])
+
+	classified = [classify_page_items(items) for items in page_items]
+	results['assemble'] = best_of(repeat, lambda: [assemble_regular_fields(f, v) for _, f, v in classified])
+
+	parsed = [parse_lab(BytesIO(r)) for r in reports]
+	with tempfile.TemporaryDirectory() as directory:
+		for name in encoders_available():
+			try:
+				results[f'encode.{name}'] = best_of(repeat, lambda: encode_records(name, parsed, directory))
+			except ImportError:
+				continue
+
+	return results
+
+
+def git_revision():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+	except OSError:
+		return None
+
+
+def print_results(results, baseline=None):
+	for stage, seconds in results.items():
+		line = f'{stage:20s} {seconds * 1000:10.2f} ms'
+		if baseline is not None and stage in baseline:
+			line += f' {baseline[stage] * 1000:10.2f} ms {seconds / baseline[stage]:7.2f}x'
+		print(line)
+
+
+def main():
+	parser = ArgumentParser(description='Time each labtool stage on synthetic reports.')
+	parser.add_argument('-n', '--reports', type=int, default=20, help='number of reports')
+	parser.add_argument('-p', '--pages', type=int, default=2, help='pages per report')
+	parser.add_argument('-F', '--fields', type=int, default=40, help='regular fields per page')
+	parser.add_argument('-C', '--comments', type=int, default=0, help='comment pages without fields per report')
+	parser.add_argument('-r', '--repeat', type=int, default=3, help='number of timing repetitions')
+	parser.add_argument('-o', '--output', help='write results as a JSON baseline')
+	parser.add_argument('-c', '--compare', metavar='BASELINE', help='compare against a JSON baseline')
+	args = parser.parse_args()
+
+	reports = [make_report(seed, args.pages, args.fields, args.comments) for seed in range(args.reports)]
+	results = run_benchmarks(reports, args.repeat)
+
+	baseline = None
+	if args.compare is not None:
+		with open(args.compare, encoding='utf-8') as f:
+			baseline = json.load(f)['results']
+
+	print_results(results, baseline)
+
+	if args.output is not None:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump({
+				'revision': git_revision(),
+				'python': platform.python_version(),
+				'parameters': {'reports': args.reports, 'pages': args.pages, 'fields': args.fields, 'comments': args.comments, 'repeat': args.repeat},
+				'results': results,
+			}, f, indent=2)
+
+
+if __name__ == '__main__':
+	main()
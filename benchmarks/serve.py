@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+import json, threading, time
+
+from argparse            import ArgumentParser
+from concurrent.futures  import ThreadPoolExecutor
+from http.client         import HTTPConnection
+from urllib.parse        import urlparse
+
+from benchmarks.generate import make_report
+from labtool.profiling   import LatencyRecorder
+from labtool.serve       import ParseService, make_server
+
+
+def post_report(host, port, report):
+	connection = HTTPConnection(host, port)
+	try:
+		start = time.perf_counter()
+		connection.request('POST', '/parse', body=report, headers={'Content-Type': 'application/pdf'})
+		response = connection.getresponse()
+		response.read()
+		if response.status != 200:
+			raise RuntimeError(f'server answered {response.status}')
+		return time.perf_counter() - start
+	finally:
+		connection.close()
+
+
+def get_metrics(host, port):
+	connection = HTTPConnection(host, port)
+	try:
+		connection.request('GET', '/metrics')
+		return json.loads(connection.getresponse().read())
+	finally:
+		connection.close()
+
+
+def main():
+	parser = ArgumentParser(description='Measure labtool serve latency with concurrent synthetic reports.')
+	parser.add_argument('-n', '--requests', type=int, default=200, help='number of requests')
+	parser.add_argument('-u', '--unique', type=int, default=50, help='number of distinct reports sent')
+	parser.add_argument('-c', '--concurrency', type=int, default=8, help='requests in flight at once')
+	parser.add_argument('-j', '--jobs', type=int, default=0, help='worker processes of the in-process server')
+	parser.add_argument('--url', help='benchmark a running server instead of starting one')
+	args = parser.parse_args()
+
+	reports = [make_report(seed) for seed in range(args.unique)]
+
+	server = None
+	if args.url is not None:
+		url = urlparse(args.url)
+		host, port = url.hostname, url.port
+	else:
+		service = ParseService(args.jobs)
+		service.start()
+		server = make_server(service, port=0)
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+		host, port = server.server_address
+
+	latency = LatencyRecorder()
+	start = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+		for seconds in executor.map(lambda i: post_report(host, port, reports[i % len(reports)]), range(args.requests)):
+			latency.record(seconds)
+	elapsed = time.perf_counter() - start
+
+	print(f'{args.requests} requests in {elapsed:.2f} s ({args.requests / elapsed:.1f} req/s)')
+	for name, seconds in latency.as_dict().items():
+		if name.startswith('p') or name == 'max':
+			print(f'client {name:5s} {seconds * 1000:10.2f} ms')
+	print(json.dumps(get_metrics(host, port), indent=2, sort_keys=True))
+
+	if server is not None:
+		server.shutdown()
+		server.server_close()
+		service.close()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+
+import json, statistics, subprocess, sys, time
+
+from argparse       import ArgumentParser
+
+from benchmarks.run import git_revision, print_results
+
+
+COMMANDS = {
+	'python':     [sys.executable, '-c', 'pass'],
+	'import':     [sys.executable, '-c', 'import labtool'],
+	'help':       [sys.executable, '-m', 'labtool', '--help'],
+	'query.help': [sys.executable, '-m', 'labtool', 'query', '--help'],
+}
+
+
+def time_command(command, repeat):
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+		timings.append(time.perf_counter() - start)
+	return min(timings), statistics.median(timings)
+
+
+def main():
+	parser = ArgumentParser(description='Time labtool startup for commands that parse no reports.')
+	parser.add_argument('-r', '--repeat', type=int, default=20, help='number of runs of each command')
+	parser.add_argument('-o', '--output', help='write results as a JSON baseline')
+	parser.add_argument('-c', '--compare', metavar='BASELINE', help='compare against a JSON baseline')
+	args = parser.parse_args()
+
+	results = {}
+	for name, command in COMMANDS.items():
+		best, median = time_command(command, args.repeat)
+		results[f'{name}.min'] = best
+		results[f'{name}.median'] = median
+
+	baseline = None
+	if args.compare is not None:
+		with open(args.compare, encoding='utf-8') as f:
+			baseline = json.load(f)['results']
+
+	print_results(results, baseline)
+
+	if args.output is not None:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump({
+				'revision': git_revision(),
+				'python': sys.version.split()[0],
+				'parameters': {'repeat': args.repeat},
+				'results': results,
+			}, f, indent=2)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,28 @@
+from importlib import import_module
+
+
+# The public API is imported on first access, so "import labtool" stays cheap
+PUBLIC_API = {
+	'parse_many'   : 'labtool.batch',
+	'ParseCache'   : 'labtool.cache',
+	'EncoderSink'  : 'labtool.encoders',
+	'encode_record': 'labtool.encoders',
+	'open_sink'    : 'labtool.encoders',
+	'Field'        : 'labtool.parse',
+	'parse_lab'    : 'labtool.parse',
+}
+
+
+def __getattr__(name):
+	module = PUBLIC_API.get(name)
+	if module is None:
+		raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+	return getattr(import_module(module), name)
+
+
+def __dir__():
+	return [*globals(), *PUBLIC_API]
+
+
+__all__ = list(PUBLIC_API)
@@ -1,34 +1,194 @@
 #!/usr/bin/python3
 
-import math, operator, os, re, sys
+import cProfile, csv, os, signal, sqlite3, sys, time
 
-from argparse         import ArgumentParser
-from dataclasses      import dataclass
-from glob             import glob
-from numbers          import Number
-from operator         import attrgetter
+from argparse          import ArgumentParser, ArgumentTypeError
+from collections       import Counter
 
-from labtool.parse    import make_field, parse_lab
-from labtool.encoders import encoders_available, make_encoder
+from labtool.batch     import ParseFailed, Prefetcher, ReadError, parse_files
+from labtool.cache     import ParseCache, content_digest
+from labtool.dedupe    import DEDUPE_MODES, KEEP_POLICIES, Deduplicator
+from labtool.discovery import find_files
+from labtool.encoders  import ENCODERS_AVAILABLE, encode_record, encoder_appendable, encoder_requires_filename, encoders_appendable, encoders_available, flush_encoder, get_encoder, make_encoder
+from labtool.manifest  import Manifest
+from labtool.parse     import EXTRACTION_ENGINES
+from labtool.profiling import BatchProfiler, null_stage
+from labtool.progress  import BatchMetrics, MetricsReporter
+
+
+def parse_column_list(value):
+	return [c.strip() for c in value.split(',') if c.strip()]
 
 
 def make_argument_parser():
-	parser = ArgumentParser(prog='labtool', description='A tool to analyze compatible lab report files.')
-	parser.add_argument('files', nargs='*', help='report files to analyze (PDF)')
-	parser.add_argument('-f', '--format', choices=encoders_available(), default='tab', help='output format')
+	parser = ArgumentParser(prog='labtool', description='A tool to analyze compatible lab report files.',
+	                        epilog='Run "labtool query -h" to look up results exported with -f sqlite, '
+	                               'or "labtool serve -h" to parse reports on request.')
+	parser.add_argument('files', nargs='*', help='report files, glob patterns or directories to search recursively')
+	parser.add_argument('--files-from', metavar='FILE', help='read report paths from FILE, one per line ("-" for stdin)')
+	parser.add_argument('-f', '--format', default='tab', metavar='FORMAT', help=f'output format: {", ".join(ENCODERS_AVAILABLE)} or an installed plugin (default: tab)')
 	parser.add_argument('-o', '--output', help='output to file instead of console')
+	parser.add_argument('--columns', type=parse_column_list, metavar='LIST', help='comma-separated columns for csv-stream output')
+	parser.add_argument('--pretty', action='store_true', help='indent json output')
+	parser.add_argument('-e', '--engine', choices=EXTRACTION_ENGINES.keys(), default='default', help='text extraction engine')
+	parser.add_argument('--max-pages', type=int, default=0, metavar='N', help='only read the first N pages of each report')
+	parser.add_argument('--all-pages', action='store_true', help='lay out every page, even those without field labels')
+	parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N', help='parse files using N worker processes (0 for one per CPU)')
+	parser.add_argument('--prefetch', type=int, default=0, metavar='K', help='read up to K files ahead on background threads')
+	parser.add_argument('--timeout', type=float, metavar='SECONDS', help='kill the worker parsing a file after SECONDS and move on')
+	parser.add_argument('--max-memory', type=float, metavar='MB', help='kill the worker parsing a file once it uses over MB of memory')
+	parser.add_argument('--quarantine', metavar='FILE', help='list files that failed to parse or exceeded --timeout or --max-memory in FILE')
+	parser.add_argument('--cache-dir', metavar='DIR', help='reuse parse results stored in DIR')
+	parser.add_argument('--cache-max-age', type=float, metavar='DAYS', help='evict cache entries unused for DAYS')
+	parser.add_argument('--cache-max-size', type=float, metavar='MB', help='evict least recently used cache entries above MB')
+	parser.add_argument('--incremental', metavar='MANIFEST', help='only parse new or changed files, appending to the output')
+	parser.add_argument('--dedupe', choices=DEDUPE_MODES, help='skip reports identical to another one (exact) or for the same request (request)')
+	parser.add_argument('--keep', choices=KEEP_POLICIES, help='which duplicate report to parse (default: first)')
+	parser.add_argument('--progress', action='store_true', help='show files and pages per second and an ETA on stderr')
+	parser.add_argument('--metrics-file', metavar='FILE', help='write batch metrics to FILE in Prometheus text format')
+	parser.add_argument('--status-file', metavar='FILE', help='write batch metrics to FILE as JSON')
+	parser.add_argument('--metrics-interval', type=float, default=10, metavar='SECONDS', help='refresh metrics every SECONDS (default: 10)')
+	parser.add_argument('--profile', action='store_true', help='report time spent in each stage to stderr')
+	parser.add_argument('--profile-top', type=int, default=10, metavar='N', help='number of slowest files to report')
+	parser.add_argument('--profile-json', metavar='FILE', help='write per-stage and per-file timings as JSON')
+	parser.add_argument('--profile-dump', metavar='FILE', help='write cProfile statistics of the main process')
 	parser.add_argument('-v', '--verbose', action='store_true', help='show additional info')
 	return parser
 
 
-def make_field_encoder(encoder, field):
-	def encode_helper(prop, value):
-		return encoder.write_property(field.name, prop, value)
+def parse_query_date(value):
+	from labtool.query import parse_date
+
+	date = parse_date(value)
+	if date is None:
+		raise ArgumentTypeError(f'invalid date: "{value}" (use YYYY-MM-DD or DD/MM/YYYY)')
+	return date
+
+
+def make_query_argument_parser():
+	parser = ArgumentParser(prog='labtool query', description='Look up results in an index exported with -f sqlite.')
+	parser.add_argument('index', help='sqlite file written by labtool -f sqlite')
+	parser.add_argument('-n', '--nhc', help='only results for this patient')
+	parser.add_argument('-F', '--field', action='append', dest='fields', metavar='FIELD', help='only results for FIELD (repeatable)')
+	parser.add_argument('--since', type=parse_query_date, metavar='DATE', help='only samples taken on or after DATE')
+	parser.add_argument('--until', type=parse_query_date, metavar='DATE', help='only samples taken on or before DATE')
+	parser.add_argument('-f', '--format', choices=['tab', 'csv'], default='tab', help='output format')
+	parser.add_argument('-v', '--verbose', action='store_true', help='show additional info')
+	return parser
+
+
+def query_main(argv):
+	parser = make_query_argument_parser()
+	args = parser.parse_args(argv)
+
+	# Imported here so the other commands don't pay for the sqlite encoder
+	from labtool.query import QUERY_COLUMNS, ResultIndex
+
+	try:
+		index = ResultIndex(args.index)
+	except sqlite3.Error as e:
+		print(f'Error opening index "{args.index}": {e}', file=sys.stderr)
+		sys.exit(-1)
+
+	start = time.perf_counter()
+	writer = csv.writer(sys.stdout, dialect='excel-tab' if args.format == 'tab' else 'excel', lineterminator='\n')
+	writer.writerow(QUERY_COLUMNS)
+
+	nrows = 0
+	for row in index.query(args.nhc, args.fields, args.since, args.until):
+		writer.writerow(row)
+		nrows += 1
+
+	index.close()
+	if args.verbose:
+		print(f'{nrows} results in {(time.perf_counter() - start) * 1000:.1f} ms', file=sys.stderr)
+
+
+def make_serve_argument_parser():
+	parser = ArgumentParser(prog='labtool serve', description='Parse reports on request over HTTP, keeping workers and the cache warm.')
+	parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+	parser.add_argument('--port', type=int, default=8765, help='port to listen on (default: 8765)')
+	parser.add_argument('--socket', metavar='PATH', help='listen on a Unix socket instead of a TCP port')
+	parser.add_argument('--root', metavar='DIR', help='serve GET /parse?path= from reports within DIR (without it, only on --socket)')
+	parser.add_argument('--max-body', type=float, default=64, metavar='MB', help='refuse reports posted with over MB of data (default: 64)')
+	parser.add_argument('-e', '--engine', choices=EXTRACTION_ENGINES.keys(), default='default', help='text extraction engine')
+	parser.add_argument('--max-pages', type=int, default=0, metavar='N', help='only read the first N pages of each report')
+	parser.add_argument('--all-pages', action='store_true', help='lay out every page, even those without field labels')
+	parser.add_argument('-j', '--jobs', type=int, default=0, metavar='N', help='parse reports using N worker processes (default: one per CPU)')
+	parser.add_argument('--timeout', type=float, default=60, metavar='SECONDS', help='kill the worker parsing a report after SECONDS (default: 60)')
+	parser.add_argument('--max-memory', type=float, metavar='MB', help='kill the worker parsing a report once it uses over MB of memory')
+	parser.add_argument('--cache-dir', metavar='DIR', help='reuse parse results stored in DIR')
+	parser.add_argument('-v', '--verbose', action='store_true', help='log every request')
+	return parser
+
+
+def serve_main(argv):
+	parser = make_serve_argument_parser()
+	args = parser.parse_args(argv)
+
+	if args.jobs < 0:
+		parser.error('argument -j/--jobs: must be a non-negative integer')
+
+	if args.max_pages < 0:
+		parser.error('argument --max-pages: must be a non-negative integer')
 
-	return encode_helper
+	if args.timeout <= 0:
+		parser.error('argument --timeout: must be a positive number')
+
+	if args.max_memory is not None and args.max_memory <= 0:
+		parser.error('argument --max-memory: must be a positive number')
+
+	if args.max_body <= 0:
+		parser.error('argument --max-body: must be a positive number')
+
+	if args.root is not None and not os.path.isdir(args.root):
+		parser.error(f'argument --root: "{args.root}" is not a directory')
+
+	# Imported here so the other commands don't pay for the HTTP server
+	from labtool.serve import ParseService, make_server
+
+	parse_options = {'engine': args.engine, 'max_pages': args.max_pages, 'prefilter': not args.all_pages}
+
+	cache = None
+	if args.cache_dir is not None:
+		try:
+			cache = ParseCache(args.cache_dir, options=parse_options)
+		except (OSError, sqlite3.Error) as e:
+			print(f'Error opening cache at "{args.cache_dir}": {e}', file=sys.stderr)
+			sys.exit(-1)
+
+	max_memory = args.max_memory * 2**20 if args.max_memory is not None else None
+	service = ParseService(args.jobs, cache, args.timeout, max_memory, **parse_options)
+	try:
+		server = make_server(service, args.host, args.port, args.socket, args.verbose, args.root, int(args.max_body * 2**20))
+	except OSError as e:
+		print(f'Error listening on "{args.socket or f"{args.host}:{args.port}"}": {e.strerror}', file=sys.stderr)
+		service.close()
+		sys.exit(-1)
+
+	workers = service.start()
+	address = args.socket if args.socket is not None else f'http://{args.host}:{server.server_address[1]}'
+	print(f'Listening on {address} with {workers} workers', file=sys.stderr)
+
+	# Service managers stop daemons with SIGTERM, which should clean up like Ctrl-C does
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		service.close()
 
 
 def main():
+	if sys.argv[1:2] == ['query']:
+		return query_main(sys.argv[2:])
+
+	if sys.argv[1:2] == ['serve']:
+		return serve_main(sys.argv[2:])
+
 	parser = make_argument_parser()
 	args = parser.parse_args()
 	out = sys.stdout
@@ -37,62 +197,252 @@ def main():
 		if args.verbose:
 			print(message, file=sys.stderr)
 
+	if args.jobs < 0:
+		parser.error('argument -j/--jobs: must be a non-negative integer')
+
+	if args.prefetch < 0:
+		parser.error('argument --prefetch: must be a non-negative integer')
+
+	if args.max_pages < 0:
+		parser.error('argument --max-pages: must be a non-negative integer')
+
+	if args.timeout is not None and args.timeout <= 0:
+		parser.error('argument --timeout: must be a positive number')
+
+	if args.max_memory is not None and args.max_memory <= 0:
+		parser.error('argument --max-memory: must be a positive number')
+
+	if args.metrics_interval <= 0:
+		parser.error('argument --metrics-interval: must be a positive number')
+
+	if args.keep is not None and args.dedupe is None:
+		parser.error('argument --keep: requires --dedupe')
+
+	# Checked here rather than through choices, so plugins are only looked up when asked for
+	if get_encoder(args.format) is None:
+		parser.error(f'argument -f/--format: invalid choice: "{args.format}" (choose from {", ".join(encoders_available())})')
+
+	if args.incremental is not None and not encoder_appendable(args.format):
+		parser.error(f'argument --incremental: output format must be one of {", ".join(encoders_appendable())}')
+
 	if len(sys.argv) == 1:
 		parser.print_help(file=sys.stderr)
 		sys.exit()
 
-	if args.output is not None:
+	if encoder_requires_filename(args.format):
+		if args.output is None:
+			parser.error(f'argument -f/--format: {args.format} output requires -o/--output')
+		out = None
+
+	elif args.output is not None:
 		try:
-			out = open(args.output, 'w', encoding='utf-8', newline='')
+			mode = 'a' if args.incremental is not None else 'w'
+			out = open(args.output, mode, encoding='utf-8', newline='')
 		except IOError as e:
 			print(f'Error writing to "{args.output}": {e.strerror}', file=sys.stderr)
 			sys.exit(-1)
 
+	parse_options = {'engine': args.engine, 'max_pages': args.max_pages, 'prefilter': not args.all_pages}
+	counters = Counter()
+	digests = {}
+	prefetcher = Prefetcher(args.prefetch)
+	limits = {'timeout': args.timeout, 'max_memory': args.max_memory * 2**20 if args.max_memory is not None else None}
+	quarantined = []
+	metrics = BatchMetrics(prefetcher, counters)
+
+	cache = None
+	if args.cache_dir is not None:
+		max_age = args.cache_max_age * 86400 if args.cache_max_age is not None else None
+		max_size = args.cache_max_size * 2**20 if args.cache_max_size is not None else None
+		try:
+			cache = ParseCache(args.cache_dir, max_age=max_age, max_size=max_size, options=parse_options)
+		except (OSError, sqlite3.Error) as e:
+			print(f'Error opening cache at "{args.cache_dir}": {e}', file=sys.stderr)
+			sys.exit(-1)
+
+	manifest = None
+	if args.incremental is not None:
+		try:
+			manifest = Manifest(args.incremental)
+		except sqlite3.Error as e:
+			print(f'Error opening manifest "{args.incremental}": {e}', file=sys.stderr)
+			sys.exit(-1)
+
+		# Files are recorded with the digest of the content parsed, instead of reading them again
+		prefetcher.on_read = lambda path, content: digests.__setitem__(path, content_digest(content))
+
+	files_from = None
+	if args.files_from == '-':
+		files_from = sys.stdin
+	elif args.files_from is not None:
+		try:
+			files_from = open(args.files_from, encoding='utf-8')
+		except OSError as e:
+			print(f'Error reading "{args.files_from}": {e.strerror}', file=sys.stderr)
+			sys.exit(-1)
+
+	profiler = None
+	if args.profile or args.profile_json is not None:
+		profiler = BatchProfiler()
+
+	def stage(path, name):
+		return profiler.stage(path, name) if profiler is not None else null_stage(name)
+
+	reporter = None
+	if args.progress or args.metrics_file is not None or args.status_file is not None:
+		reporter = MetricsReporter(metrics, args.metrics_interval, sys.stderr if args.progress else None,
+		                           args.metrics_file, args.status_file)
+
+	# Set while records may still sit in the encoder's buffers
+	open_encoder = None
+
+	def commit_manifest():
+		# Files are only marked as done once their records are stored
+		if open_encoder is not None:
+			flush_encoder(open_encoder)
+		manifest.commit()
+
+	cprofile = None
+	if args.profile_dump is not None:
+		cprofile = cProfile.Profile()
+		cprofile.enable()
+
 	try:
 		encoder = make_encoder(args, out)
 		assert(encoder is not None)
-		encoder.begin()
+
+		try:
+			encoder.begin()
+		except ImportError as e:
+			print(f'Error: {e}', file=sys.stderr)
+			sys.exit(-1)
+		open_encoder = encoder
+
+		paths = find_files(args.files, files_from)
+		if manifest is not None:
+			paths = manifest.changed_files(paths)
+
+		deduplicator = None
+		if args.dedupe is not None:
+			deduplicator = Deduplicator(args.dedupe, args.keep or 'first')
+			paths = deduplicator.unique_files(paths)
+			prefetcher.reader = deduplicator.read
+
+		paths = metrics.discover(paths)
+		if reporter is not None:
+			reporter.start()
 
 		nrecords = 0
-		for pattern in args.files:
-			path = None
-			for path in glob(pattern):
-				vprint(f'Parsing file "{path}"')
+		for path, result in parse_files(paths, args.jobs, cache, profiler, counters, prefetcher, **limits, **parse_options):
+			vprint(f'Parsing file "{path}"')
 
-				try:
-					data = None
-					with open(path, 'rb') as f:
-						data = parse_lab(f)
-						data.append(make_field('Metadata/Source', os.path.abspath(path)))
+			try:
+				data = result()
+				if data is None:
+					vprint(f'There was an error trying to parse "{path}", skipping.')
+					metrics.file_done('skipped')
+					continue
 
-					if data is None:
-						vprint(f'There was an error trying to parse "{path}", skipping.')
-						continue
+				with stage(path, 'encode'):
+					encode_record(encoder, data)
+				nrecords += 1
+				metrics.file_done('parsed', len(data))
 
-					encoder.begin_record()
-					for field in sorted(data, key=attrgetter('name')):
-						field.encode(make_field_encoder(encoder, field))
-					encoder.end_record()
-					nrecords += 1
+				if manifest is not None:
+					manifest.record(path, digests.pop(path, None))
+					if manifest.pending >= Manifest.COMMIT_INTERVAL:
+						commit_manifest()
 
-				except RuntimeError:
-					print(f'There was an error trying to open "{path}", skipping...', file=sys.stderr)
+			# The same whether the report was parsed here, in a pool or on an isolated worker
+			except ParseFailed as e:
+				print(f'Parsing "{path}" failed ({e}), skipping...', file=sys.stderr)
+				quarantined.append((path, e))
+				metrics.file_done('quarantined')
 
-			if not path:
-				print(f'No files found matching "{pattern}"', file=sys.stderr)
+			except ReadError as e:
+				print(f'There was an error trying to read "{path}": {e.strerror}, skipping...', file=sys.stderr)
+				metrics.file_done('failed')
 
 		encoder.end()
+		open_encoder = None
+		if manifest is not None:
+			commit_manifest()
+
+		if quarantined:
+			print(f'Quarantined {len(quarantined)} files:', file=sys.stderr)
+			for path, e in quarantined:
+				print(f'  {path}: {e}', file=sys.stderr)
+
+		if args.quarantine is not None:
+			try:
+				with open(args.quarantine, 'w', encoding='utf-8', newline='') as f:
+					writer = csv.writer(f, dialect='excel-tab', lineterminator='\n')
+					writer.writerows((path, e.reason, e.detail) for path, e in quarantined)
+			except OSError as e:
+				print(f'Error writing to "{args.quarantine}": {e.strerror}', file=sys.stderr)
 
 		if args.output is not None:
-			if nrecords == 0:
+			if nrecords == 0 and manifest is None:
 				print(f'No output files were generated', file=sys.stderr)
 				sys.exit(-1)
 
 			vprint(f'Writing data to "{args.output}"')
 
+		if deduplicator is not None:
+			for path, kept in deduplicator.duplicates:
+				vprint(f'Skipped "{path}", duplicate of "{kept}"')
+			vprint(f'Dedupe: {len(deduplicator.duplicates)} duplicate files skipped')
+
+		vprint(f'Reads: {prefetcher.reads} files, {prefetcher.mean_ready:.1f} buffered on average, {prefetcher.wait:.2f}s waiting for I/O')
+		vprint(f'Pages: {counters["pages"]} read, {counters["pages_skipped"]} skipped without field labels')
+
+	# Read errors are handled per file above, so this is the output failing
+	except OSError as e:
+		if isinstance(e, BrokenPipeError):
+			# Keeps Python from reporting the closed pipe again when flushing at exit
+			os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+		print(f'Error writing output: {e.strerror or e}', file=sys.stderr)
+		sys.exit(-1)
+
 	finally:
-		if out is not sys.stdout:
-			out.close()
+		if reporter is not None:
+			reporter.stop()
+
+		if cprofile is not None:
+			cprofile.disable()
+			cprofile.dump_stats(args.profile_dump)
+
+		if profiler is not None:
+			if args.profile:
+				profiler.print_summary(sys.stderr, args.profile_top)
+
+			if args.profile_json is not None:
+				with open(args.profile_json, 'w', encoding='utf-8') as f:
+					profiler.write_json(f)
+
+		if files_from is not None and files_from is not sys.stdin:
+			files_from.close()
+
+		if manifest is not None:
+			# After an error, files already encoded are kept if their records can still be stored
+			if open_encoder is not None:
+				try:
+					commit_manifest()
+				except (OSError, sqlite3.Error):
+					pass
+			manifest.close()
+			vprint(f'Manifest: {manifest.changed} new or changed, {manifest.unchanged} unchanged')
+
+		if cache is not None:
+			cache.close()
+			vprint(f'Cache: {cache.hits} hits, {cache.misses} misses, {cache.evicted} evicted, {cache.errors} errors')
+
+		if out is not None and out is not sys.stdout:
+			try:
+				out.close()
+			except OSError:
+				# Already reported, closing flushes what could not be written
+				pass
 
 
 if __name__ == '__main__':
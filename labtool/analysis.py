@@ -0,0 +1,49 @@
+import math
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+LIMIT_OPERATORS = ['ge', 'gt', 'le', 'lt']
+
+
+def require_numpy():
+	if np is None:
+		raise ImportError('numpy is required for batch analysis (pip install labtool[analysis])')
+
+
+def to_float(value):
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return math.nan
+
+
+def flag_out_of_range(values, limits, qualifiers=None):
+	v = np.asarray(values, dtype=float)
+	ge, gt, le, lt = (np.asarray(limits[op], dtype=float) for op in LIMIT_OPERATORS)
+
+	below = above = np.zeros(len(v), dtype=bool)
+	if qualifiers is not None:
+		q = np.asarray(qualifiers, dtype=object)
+		below, above = q == '<', q == '>'
+
+	# Comparisons against missing values or limits (NaN) are false, so those never flag.
+	# Censored values only flag when every value they stand for is out of range.
+	low = np.where(below, v <= ge, v < ge) | (v <= gt)
+	high = np.where(above, v >= le, v > le) | (v >= lt)
+	return (low & ~above) | (high & ~below)
+
+
+def summarize_flags(names, codes, values, flagged):
+	codes = np.asarray(codes, dtype=np.intp)
+	numeric = ~np.isnan(np.asarray(values, dtype=float))
+
+	results = np.bincount(codes, weights=numeric, minlength=len(names))
+	abnormal = np.bincount(codes, weights=flagged, minlength=len(names))
+	rates = np.divide(abnormal, results, out=np.zeros_like(abnormal), where=results > 0)
+
+	summary = [(name, int(n), int(a), r) for name, n, a, r in zip(names, results, abnormal, rates) if n > 0]
+	return sorted(summary)
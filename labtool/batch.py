@@ -0,0 +1,272 @@
+import os, time
+
+from collections        import Counter, deque
+from io                 import BytesIO
+
+from labtool.cache      import ParseCache
+from labtool.parse      import make_field, parse_lab
+from labtool.profiling  import StageProfiler, null_stage
+
+
+# Raised for any report that could not be parsed, whether or not it ran on a separate process
+class ParseFailed(RuntimeError):
+
+	def __init__(self, reason, detail):
+		super().__init__(f'{reason}: {detail}')
+		self.reason = reason
+		self.detail = detail
+
+
+class WorkerKilled(ParseFailed):
+	pass
+
+
+def parse_failed(e):
+	error = ParseFailed('error', f'{type(e).__name__}: {e}')
+	error.__cause__ = e
+	return error
+
+
+# Raised for reports that cannot be read, as opposed to errors writing the output
+class ReadError(OSError):
+	pass
+
+
+def read_file(path):
+	with open(path, 'rb') as f:
+		return f.read()
+
+
+# Sources are paths, binary file objects or the contents of a report
+def read_source(source):
+	if isinstance(source, (bytes, bytearray, memoryview)):
+		return bytes(source)
+	if hasattr(source, 'read'):
+		return source.read()
+	return read_file(source)
+
+
+def source_name(source):
+	if isinstance(source, (str, os.PathLike)):
+		return os.path.abspath(source)
+
+	name = getattr(source, 'name', None)
+	if isinstance(name, str):
+		return os.path.abspath(name)
+	return None
+
+
+class Prefetcher:
+
+	def __init__(self, depth=0, on_read=None, reader=None):
+		self.depth = depth
+		self.on_read = on_read
+		# Lets callers hand over contents they already read, e.g. while looking for duplicates
+		self.reader = reader
+		self.reads = 0
+		self.ready = 0
+		self.wait = 0.0
+		self.bytes = 0
+
+	def _load(self, path):
+		return self.reader(path) if self.reader is not None else read_source(path)
+
+	def _read(self, path):
+		start = time.perf_counter()
+		try:
+			content = self._load(path)
+		except OSError as e:
+			raise ReadError(e.errno, e.strerror, e.filename) from e
+		finally:
+			self.wait += time.perf_counter() - start
+			self.reads += 1
+
+		return self._received(path, content)
+
+	def _resolve(self, path, future):
+		start = time.perf_counter()
+		try:
+			content = future.result()
+		except OSError as e:
+			raise ReadError(e.errno, e.strerror, e.filename) from e
+		finally:
+			self.wait += time.perf_counter() - start
+			self.reads += 1
+
+		return self._received(path, content)
+
+	def _received(self, path, content):
+		self.bytes += len(content)
+		# Lets callers reuse the content, e.g. to digest it, without reading the file again
+		if self.on_read is not None:
+			self.on_read(path, content)
+		return content
+
+	def read_files(self, paths):
+		if self.depth == 0:
+			for path in paths:
+				yield path, lambda path=path: self._read(path)
+			return
+
+		from concurrent.futures import ThreadPoolExecutor
+
+		with ThreadPoolExecutor(max_workers=self.depth) as executor:
+			pending = deque()
+
+			def advance():
+				path, future = pending.popleft()
+				# Files already in memory when one is requested, including itself
+				self.ready += future.done() + sum(f.done() for _, f in pending)
+				return path, lambda: self._resolve(path, future)
+
+			for path in paths:
+				pending.append((path, executor.submit(self._load, path)))
+				if len(pending) > self.depth:
+					yield advance()
+
+			while pending:
+				yield advance()
+
+	@property
+	def mean_ready(self):
+		return self.ready / self.reads if self.reads else 0.0
+
+
+def parse_content(content, profiler=None, counters=None, **options):
+	return parse_lab(BytesIO(content), profiler=profiler, counters=counters, **options)
+
+
+def parse_content_worker(content, profile=False, **options):
+	profiler = StageProfiler() if profile else None
+	counters = Counter()
+	return parse_content(content, profiler, counters, **options), profiler, counters
+
+
+def add_source(data, source):
+	name = source_name(source)
+	if data is not None and name is not None:
+		data.append(make_field('Metadata/Source', name))
+
+	return data
+
+
+def parse_file(path, cache=None, profiler=None, counters=None, read=None, **options):
+	stages = profiler.file(path) if profiler is not None else None
+	stage = stages.stage if stages is not None else null_stage
+
+	with stage('read'):
+		content = read() if read is not None else read_source(path)
+
+	data = None
+	if cache is not None:
+		with stage('cache'):
+			data = cache.get(content)
+
+	if data is None:
+		try:
+			data = parse_content(content, stages, counters, **options)
+		except Exception as e:
+			raise parse_failed(e)
+		if cache is not None and data is not None:
+			with stage('cache'):
+				cache.put(content, data)
+
+	return add_source(data, path)
+
+
+def make_executor(workers, timeout=None, max_memory=None):
+	# Imported here as they pull in multiprocessing, which serial runs never need
+	if timeout is None and max_memory is None:
+		from concurrent.futures import ProcessPoolExecutor
+		return ProcessPoolExecutor(max_workers=workers)
+
+	from labtool.isolation import IsolatedExecutor
+	return IsolatedExecutor(workers, timeout, max_memory)
+
+
+def parse_files(paths, jobs=1, cache=None, profiler=None, counters=None, prefetcher=None, timeout=None, max_memory=None, **options):
+	if prefetcher is None:
+		prefetcher = Prefetcher()
+	sources = prefetcher.read_files(paths)
+
+	# Limits can only be enforced on a separate process, even for serial runs
+	isolated = timeout is not None or max_memory is not None
+
+	if jobs == 1 and not isolated:
+		for path, read in sources:
+			yield path, lambda path=path, read=read: parse_file(path, cache, profiler, counters, read, **options)
+		return
+
+	workers = jobs or os.cpu_count() or 1
+	with make_executor(workers, timeout, max_memory) as executor:
+
+		def submit(path, read):
+			stage = (lambda name: profiler.stage(path, name)) if profiler is not None else null_stage
+
+			try:
+				with stage('read'):
+					content = read()
+			except OSError as e:
+				def failed(e=e):
+					raise e
+				return failed
+
+			if cache is not None:
+				with stage('cache'):
+					data = cache.get(content)
+				if data is not None:
+					return lambda: add_source(data, path)
+
+			future = executor.submit(parse_content_worker, content, profiler is not None, **options)
+
+			def result():
+				try:
+					data, stages, worker_counters = future.result()
+				except ParseFailed:
+					raise
+				except Exception as e:
+					raise parse_failed(e)
+				if profiler is not None:
+					profiler.file(path).merge(stages)
+				if counters is not None:
+					counters.update(worker_counters)
+
+				if cache is not None and data is not None:
+					with stage('cache'):
+						cache.put(content, data)
+
+				return add_source(data, path)
+
+			return result
+
+		pending = deque()
+		for path, read in sources:
+			pending.append((path, submit(path, read)))
+			if len(pending) > 2 * workers:
+				yield pending.popleft()
+
+		while pending:
+			yield pending.popleft()
+
+
+def parse_many(sources, jobs=1, cache=None, prefetch=0, on_error=None, timeout=None, max_memory=None, **options):
+	owned = isinstance(cache, (str, os.PathLike))
+	if owned:
+		cache = ParseCache(cache, options=options)
+
+	try:
+		for source, result in parse_files(sources, jobs, cache, prefetcher=Prefetcher(prefetch),
+		                                      timeout=timeout, max_memory=max_memory, **options):
+			try:
+				data = result()
+			except Exception as e:
+				if on_error is None:
+					raise
+				on_error(source, e)
+				continue
+
+			yield source, data
+
+	finally:
+		if owned:
+			cache.close()
@@ -0,0 +1,156 @@
+import hashlib, os, pickle, sqlite3, time
+
+from labtool import parse
+
+
+def parser_fingerprint():
+	h = hashlib.sha256()
+	# Every table that decides how lines are normalized, classified or named
+	for table in [parse.PARSER_VERSION, parse.STANDALONE_FIELDS, parse.FIELD_PREFIXES, sorted(parse.FIELD_MAPPING.items()),
+	              sorted(parse.CHARACTER_FOLDING.items()), parse.DUAL_FIELDS, parse.KNOWN_UNITS]:
+		h.update(repr(table).encode('utf-8'))
+	return h.hexdigest()
+
+
+def options_key(options=None):
+	return repr(sorted({**parse.PARSE_OPTIONS, **(options or {})}.items()))
+
+
+def content_digest(content):
+	return hashlib.sha256(content).hexdigest()
+
+
+def file_digest(path, chunk_size=2**20):
+	# Same digest as content_digest, without holding the whole file in memory
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(chunk_size), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+class ParseCache:
+
+	FILENAME = 'labtool-cache.sqlite3'
+	COMMIT_INTERVAL = 64
+	# Long-running processes such as labtool serve write out what they have at least this often
+	COMMIT_SECONDS = 5.0
+	# Other processes sharing the cache hold its lock only while they write a batch
+	BUSY_TIMEOUT = 5.0
+
+	def __init__(self, directory, max_age=None, max_size=None, options=None):
+		os.makedirs(directory, exist_ok=True)
+		# Callers sharing a cache between threads serialize access themselves
+		self._db = sqlite3.connect(os.path.join(directory, self.FILENAME), timeout=self.BUSY_TIMEOUT,
+		                           check_same_thread=False)
+		# Readers don't block writers, so a running server and a batch can share the cache
+		self._db.execute('PRAGMA journal_mode=WAL')
+
+		# Caches written before options had their own column are simply started over
+		columns = [row[1] for row in self._db.execute('PRAGMA table_info(results)')]
+		if columns and 'options' not in columns:
+			self._db.execute('DROP TABLE results')
+
+		self._db.execute('''
+			CREATE TABLE IF NOT EXISTS results (
+				digest      TEXT NOT NULL,
+				fingerprint TEXT NOT NULL,
+				options     TEXT NOT NULL,
+				data        BLOB NOT NULL,
+				created     REAL NOT NULL,
+				accessed    REAL NOT NULL,
+				PRIMARY KEY (digest, fingerprint, options)
+			)''')
+		self._db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+		self._db.commit()
+		self._fingerprint = parser_fingerprint()
+		self._options = options_key(options)
+		self.max_age = max_age
+		self.max_size = max_size
+		self.hits = 0
+		self.misses = 0
+		self.evicted = 0
+		self.errors = 0
+		# Writes are kept here and stored in short batches, so no transaction stays open between calls
+		self._added = {}
+		self._accessed = {}
+		self._committed = time.monotonic()
+
+	def get(self, content):
+		digest = content_digest(content)
+		if digest in self._added:
+			self.hits += 1
+			return pickle.loads(self._added[digest][3])
+
+		try:
+			row = self._db.execute('SELECT data FROM results WHERE digest = ? AND fingerprint = ? AND options = ?',
+			                       (digest, self._fingerprint, self._options)).fetchone()
+		except sqlite3.Error:
+			# A cache that cannot be read, e.g. locked for too long, only costs a parse
+			self.errors += 1
+			row = None
+
+		if row is None:
+			self.misses += 1
+			return None
+
+		self._accessed[digest] = time.time()
+		self._queued()
+		self.hits += 1
+		return pickle.loads(row[0])
+
+	def put(self, content, data):
+		now = time.time()
+		digest = content_digest(content)
+		self._added[digest] = (digest, self._fingerprint, self._options, pickle.dumps(data), now, now)
+		self._accessed.pop(digest, None)
+		self._queued()
+
+	def _queued(self):
+		if (len(self._added) + len(self._accessed) >= self.COMMIT_INTERVAL
+		    or time.monotonic() - self._committed >= self.COMMIT_SECONDS):
+			self.commit()
+
+	def commit(self):
+		added, self._added = list(self._added.values()), {}
+		accessed, self._accessed = self._accessed, {}
+		self._committed = time.monotonic()
+		if not added and not accessed:
+			return
+
+		try:
+			with self._db:
+				self._db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)', added)
+				self._db.executemany('UPDATE results SET accessed = ? WHERE digest = ? AND fingerprint = ? AND options = ?',
+				                     [(t, digest, self._fingerprint, self._options) for digest, t in accessed.items()])
+		except sqlite3.Error:
+			# These results are only lost to later runs, which will parse the reports again
+			self.errors += 1
+
+	def evict(self):
+		# Entries for other parse options stay valid, so only age and size limits remove them
+		with self._db:
+			cursor = self._db.execute('DELETE FROM results WHERE fingerprint != ?', (self._fingerprint,))
+			self.evicted += cursor.rowcount
+
+			if self.max_age is not None:
+				cursor = self._db.execute('DELETE FROM results WHERE accessed < ?', (time.time() - self.max_age,))
+				self.evicted += cursor.rowcount
+
+			if self.max_size is not None:
+				total = 0
+				rows = self._db.execute('SELECT rowid, length(data) FROM results ORDER BY accessed DESC').fetchall()
+				for rowid, size in rows:
+					total += size
+					if total > self.max_size:
+						self._db.execute('DELETE FROM results WHERE rowid = ?', (rowid,))
+						self.evicted += 1
+
+	def close(self):
+		self.commit()
+		try:
+			self.evict()
+		except sqlite3.Error:
+			# Another process is busy with the cache; eviction can wait for a later run
+			self.errors += 1
+		self._db.close()
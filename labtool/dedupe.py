@@ -0,0 +1,95 @@
+import os
+
+from labtool.batch import read_file, read_source
+from labtool.cache import content_digest, file_digest
+from labtool.parse import extract_header_fields
+
+
+DEDUPE_MODES  = ['exact', 'request']
+KEEP_POLICIES = ['first', 'latest', 'largest']
+
+
+def header_request_id(path):
+	# Only the first page is read, not the whole report
+	with open(path, 'rb') as f:
+		try:
+			return extract_header_fields(f).get('Peticio/ID') or None
+		except Exception:
+			# Unreadable reports are kept, so the full parse reports them as usual
+			return None
+
+
+class Deduplicator:
+
+	def __init__(self, mode='exact', keep='first'):
+		self.mode = mode
+		self.keep = keep
+		self.duplicates = []
+		self._contents = {}
+
+	def _key(self, path):
+		try:
+			if self.mode == 'request':
+				request_id = header_request_id(path)
+				if request_id is not None:
+					return ('request', request_id), None
+
+			# Other policies examine every file before parsing any, so contents are not kept
+			if self.keep != 'first':
+				return ('digest', file_digest(path)), None
+
+			content = read_file(path)
+		except OSError:
+			return None, None
+
+		return ('digest', content_digest(content)), content
+
+	def read(self, path):
+		# Files kept by content are handed to the parser without reading them again
+		content = self._contents.pop(path, None)
+		return content if content is not None else read_source(path)
+
+	def _rank(self, path, index):
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None
+
+		# Ties go to the file listed first
+		if self.keep == 'latest':
+			return st.st_mtime_ns, -index
+		if self.keep == 'largest':
+			return st.st_size, -index
+		return 0, -index
+
+	def unique_files(self, paths):
+		if self.keep == 'first':
+			kept = {}
+			for path in paths:
+				key, content = self._key(path)
+				if key is None:
+					yield path
+				elif key not in kept:
+					kept[key] = path
+					if content is not None:
+						self._contents[path] = content
+					yield path
+				else:
+					self.duplicates.append((path, kept[key]))
+			return
+
+		# Any later file may replace the one kept, so every file is examined first
+		candidates = [(path, self._key(path)[0], self._rank(path, i)) for i, path in enumerate(paths)]
+
+		best = {}
+		for path, key, rank in candidates:
+			if key is None or rank is None:
+				continue
+			if key not in best or rank > best[key][1]:
+				best[key] = path, rank
+
+		for path, key, rank in candidates:
+			if key is None or rank is None or best[key][0] == path:
+				yield path
+			else:
+				self.duplicates.append((path, best[key][0]))
@@ -0,0 +1,74 @@
+import os, sys
+
+from glob import iglob
+
+
+REPORT_EXTENSIONS = ('.pdf',)
+
+
+def walk_directory(path, visited):
+	try:
+		with os.scandir(path) as it:
+			entries = sorted(it, key=lambda e: e.name)
+	except OSError as e:
+		print(f'Cannot list directory "{path}": {e.strerror}', file=sys.stderr)
+		return
+
+	subdirectories = []
+	for entry in entries:
+		try:
+			if entry.is_dir():
+				subdirectories.append(entry.path)
+			elif entry.is_file() and entry.name.lower().endswith(REPORT_EXTENSIONS):
+				yield entry.path
+		except OSError:
+			continue
+
+	for subdirectory in subdirectories:
+		# Symbolic links may lead back to a directory already walked
+		real = os.path.realpath(subdirectory)
+		if real not in visited:
+			visited.add(real)
+			yield from walk_directory(subdirectory, visited)
+
+
+def expand_path(path, visited):
+	if not os.path.isdir(path):
+		yield path
+		return
+
+	real = os.path.realpath(path)
+	if real not in visited:
+		visited.add(real)
+		yield from walk_directory(path, visited)
+
+
+def read_path_list(file):
+	for line in file:
+		path = line.rstrip('\r\n')
+		if path:
+			yield path
+
+
+def find_files(patterns, files_from=None):
+	seen = set()
+	visited = set()
+
+	def unique(paths):
+		for path in paths:
+			real = os.path.realpath(path)
+			if real not in seen:
+				seen.add(real)
+				yield path
+
+	for pattern in patterns:
+		matched = False
+		for match in iglob(pattern, recursive=True):
+			matched = True
+			yield from unique(expand_path(match, visited))
+
+		if not matched:
+			print(f'No files found matching "{pattern}"', file=sys.stderr)
+
+	if files_from is not None:
+		yield from unique(p for path in read_path_list(files_from) for p in expand_path(path, visited))
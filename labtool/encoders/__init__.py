@@ -1,19 +1,108 @@
-from .csv  import CSVEncoder
-from .json import JSONEncoder
-from .tab  import TabEncoder
+from functools import lru_cache
+from importlib import import_module
+from operator  import attrgetter
 
 
+# Encoder modules are imported on first use, so only the selected format is loaded
 ENCODERS_AVAILABLE = {
-	'tab' : TabEncoder,
-	'csv' : CSVEncoder,
-	'json': JSONEncoder,
+	'tab'       : 'labtool.encoders.tab:TabEncoder',
+	'csv'       : 'labtool.encoders.csv:CSVEncoder',
+	'csv-stream': 'labtool.encoders.csv:StreamingCSVEncoder',
+	'json'      : 'labtool.encoders.json:JSONEncoder',
+	'jsonl'     : 'labtool.encoders.json:JSONLinesEncoder',
+	'flags'     : 'labtool.encoders.flags:FlagsEncoder',
+	'sqlite'    : 'labtool.encoders.sqlite:SQLiteEncoder',
 }
 
+# Packages can add formats by declaring entry points in this group
+ENTRY_POINT_GROUP = 'labtool.encoders'
+
+
+@lru_cache(None)
+def plugin_encoders():
+	try:
+		from importlib.metadata import entry_points
+	except ImportError:
+		return {}
+
+	eps = entry_points()
+	group = eps.select(group=ENTRY_POINT_GROUP) if hasattr(eps, 'select') else eps.get(ENTRY_POINT_GROUP, [])
+	return {ep.name: ep for ep in group if ep.name not in ENCODERS_AVAILABLE}
+
+
+@lru_cache(None)
+def get_encoder(name):
+	spec = ENCODERS_AVAILABLE.get(name)
+	if spec is not None:
+		module, _, attr = spec.partition(':')
+		return getattr(import_module(module), attr)
+
+	ep = plugin_encoders().get(name)
+	return ep.load() if ep is not None else None
+
 
 def make_encoder(args, out):
-	Encoder = ENCODERS_AVAILABLE.get(args.format)
-	return Encoder(out) if Encoder else None
+	Encoder = get_encoder(args.format)
+	if Encoder is None:
+		return None
+
+	if hasattr(Encoder, 'from_args'):
+		return Encoder.from_args(args, out)
+
+	return Encoder(out)
 
 
 def encoders_available():
-	return ENCODERS_AVAILABLE.keys()
\ No newline at end of file
+	return [*ENCODERS_AVAILABLE, *plugin_encoders()]
+
+
+def encoder_requires_filename(name):
+	return getattr(get_encoder(name), 'REQUIRES_FILENAME', False)
+
+
+def encoder_appendable(name):
+	return getattr(get_encoder(name), 'APPENDABLE', False)
+
+
+def encoders_appendable():
+	return [name for name in encoders_available() if encoder_appendable(name)]
+
+
+# Encoders that buffer records write them out on flush, if they support it
+def flush_encoder(encoder):
+	flush = getattr(encoder, 'flush', None)
+	if flush is not None:
+		flush()
+
+
+def encode_record(encoder, fields):
+	encoder.begin_record()
+	for field in sorted(fields, key=attrgetter('name')):
+		field.encode(lambda prop, value, name=field.name: encoder.write_property(name, prop, value))
+	encoder.end_record()
+
+
+class EncoderSink:
+
+	def __init__(self, encoder):
+		self.encoder = encoder
+		self.nrecords = 0
+
+	def __enter__(self):
+		self.encoder.begin()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.encoder.end()
+
+	def write(self, fields):
+		encode_record(self.encoder, fields)
+		self.nrecords += 1
+
+
+def open_sink(name, target, **kwargs):
+	Encoder = get_encoder(name)
+	if Encoder is None:
+		raise ValueError(f'unknown output format "{name}"')
+
+	return EncoderSink(Encoder(target, **kwargs))
@@ -1,8 +1,20 @@
-import csv
+import csv, sys
+
+from .. import parse
+
+
+def read_csv_header(filename):
+	try:
+		with open(filename, encoding='utf-8', newline='') as f:
+			return next(csv.reader(f), None)
+	except FileNotFoundError:
+		return None
 
 
 class CSVEncoder:
 
+	APPENDABLE = False
+
 	def __init__(self, file):
 		self._file = file
 		self._rows = []
@@ -18,7 +30,9 @@ class CSVEncoder:
 		self._current_row = {}
 
 	def write_property(self, field, property, value):
-		if property != 'value':
+		if property == 'qualifier':
+			field = parse.qualifier_column(field)
+		elif property != 'value':
 			return
 
 		self._colnames.add(field)
@@ -32,3 +46,65 @@ class CSVEncoder:
 		writer = csv.DictWriter(self._file, sorted(self._colnames))
 		writer.writeheader()
 		writer.writerows(self._rows)
+
+
+class StreamingCSVEncoder:
+
+	APPENDABLE = True
+	# Standalone fields without a mapping keep the name printed on the report
+	DEFAULT_COLUMNS = sorted(set(parse.FIELD_MAPPING.values()) | set(parse.METADATA_FIELDS) |
+	                         {parse.apply_field_mapping(f) for f in parse.STANDALONE_FIELDS} |
+	                         {parse.qualifier_column(parse.FIELD_MAPPING[k]) for k in parse.REGULAR_FIELD_KEYS})
+
+	def __init__(self, file, columns=None, header=True, warn=None):
+		self._file = file
+		self._columns = columns or self.DEFAULT_COLUMNS
+		self._known = set(self._columns)
+		self._header = header
+		self._warn = warn
+		self._dropped = set()
+		self._writer = None
+		self._current_row = None
+
+	@classmethod
+	def from_args(cls, args, file):
+		warn = (lambda message: print(message, file=sys.stderr)) if args.verbose else None
+
+		if args.incremental is not None and args.output is not None:
+			columns = read_csv_header(args.output)
+			if columns:
+				return cls(file, columns=columns, header=False, warn=warn)
+
+		# Columns chosen with --columns leave the others out on purpose
+		return cls(file, columns=args.columns, warn=warn if args.columns is None else None)
+
+	def begin(self):
+		self._writer = csv.DictWriter(self._file, self._columns, extrasaction='ignore')
+		if self._header:
+			self._writer.writeheader()
+		self._current_row = None
+
+	def begin_record(self):
+		self._current_row = {}
+
+	def write_property(self, field, property, value):
+		if property == 'qualifier':
+			field = parse.qualifier_column(field)
+		elif property != 'value':
+			return
+
+		self._current_row[field] = value
+
+		# Columns are fixed once the header is written, so other fields can only be left out
+		if field not in self._known and field not in self._dropped:
+			self._dropped.add(field)
+			if self._warn is not None:
+				self._warn(f'Column "{field}" is not in the output, leaving it out')
+
+	def end_record(self):
+		self._writer.writerow(self._current_row)
+		self._file.flush()
+		self._current_row = None
+
+	def end(self):
+		pass
@@ -0,0 +1,90 @@
+import math
+
+from ..  import analysis, parse
+from .tab import format_value
+
+
+class FlagsEncoder:
+
+	APPENDABLE = False
+
+	# Header fields such as Pacient/Edat have values too, but no reference range to flag against
+	RESULT_FIELDS = frozenset(parse.FIELD_MAPPING[k] for k in parse.REGULAR_FIELD_KEYS)
+
+	def __init__(self, file):
+		self._file = file
+		self._sources = []
+		self._records = []
+		self._field_codes = {}
+		self._fields = []
+		self._values = []
+		self._qualifiers = []
+		self._texts = []
+		self._units = []
+		self._limits = {op: [] for op in analysis.LIMIT_OPERATORS}
+		self._source = None
+		self._results = None
+
+	def begin(self):
+		analysis.require_numpy()
+
+	def begin_record(self):
+		self._source = None
+		self._results = {}
+
+	def write_property(self, field, property, value):
+		if field == 'Metadata/Source' and property == 'value':
+			self._source = value
+
+		result = self._results.setdefault(field, {})
+		if not property.startswith('refvalue'):
+			result[property] = value
+			return
+
+		# Keep the strictest limit when a field carries several intervals
+		_, op = property.split('.')
+		if op in result:
+			value = max(result[op], value) if op in ('ge', 'gt') else min(result[op], value)
+		result[op] = value
+
+	def end_record(self):
+		record = len(self._sources)
+		self._sources.append(self._source)
+
+		for field, result in self._results.items():
+			if field not in self.RESULT_FIELDS or result.get('value') is None:
+				continue
+
+			self._records.append(record)
+			self._fields.append(self._field_codes.setdefault(field, len(self._field_codes)))
+			self._values.append(result['value'])
+			self._qualifiers.append(result.get('qualifier'))
+			self._texts.append(result.get('text'))
+			self._units.append(result.get('unit'))
+			for op in analysis.LIMIT_OPERATORS:
+				self._limits[op].append(result.get(op, math.nan))
+
+		self._results = None
+
+	def _format_limits(self, i):
+		signs = {'ge': '>=', 'gt': '>', 'le': '<=', 'lt': '<'}
+		return ' '.join(f'{signs[op]}{self._limits[op][i]:g}' for op in analysis.LIMIT_OPERATORS
+		                if not math.isnan(self._limits[op][i]))
+
+	def end(self):
+		if not self._values:
+			return
+
+		names = list(self._field_codes)
+		values = [analysis.to_float(v) for v in self._values]
+		flagged = analysis.flag_out_of_range(values, self._limits, self._qualifiers)
+
+		print('Flagged values', file=self._file)
+		for i in flagged.nonzero()[0]:
+			source = self._sources[self._records[i]] or f'#{self._records[i] + 1}'
+			print(f'{source}\t{names[self._fields[i]]}\t{format_value(self._values[i], self._qualifiers[i], self._texts[i])}\t{self._units[i] or ""}\t{self._format_limits(i)}', file=self._file)
+
+		print(file=self._file)
+		print(f'{"Field":30s} {"Results":>8s} {"Abnormal":>8s} {"Rate":>7s}', file=self._file)
+		for name, results, abnormal, rate in analysis.summarize_flags(names, self._fields, values, flagged):
+			print(f'{name:30s} {results:8d} {abnormal:8d} {100 * rate:6.1f}%', file=self._file)
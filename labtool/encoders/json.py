@@ -1,21 +1,39 @@
-import json
+import json, textwrap
+
+from .. import parse
 
 
 class JSONEncoder:
 
-	def __init__(self, file):
+	APPENDABLE = False
+
+	def __init__(self, file, pretty=False):
 		self._file = file
-		self._rows = []
-		self._current_row = None
+		self._pretty = pretty
+		self._data = None
+		self._nrecords = 0
+
+	@classmethod
+	def from_args(cls, args, file):
+		return cls(file, pretty=args.pretty)
+
+	def _dumps(self, record):
+		if self._pretty:
+			return json.dumps(record, sort_keys=True, indent=2)
+
+		return json.dumps(record, sort_keys=True, separators=(',', ':'))
 
 	def begin(self):
-		self._records = []
+		self._nrecords = 0
+		self._file.write('[')
 
 	def begin_record(self):
 		self._data = {}
 
 	def write_property(self, field, property, value):
-		if property != 'value':
+		if property == 'qualifier':
+			field = parse.qualifier_column(field)
+		elif property != 'value':
 			return
 
 		parent = self._data
@@ -25,8 +43,39 @@ class JSONEncoder:
 		parent[name] = value
 
 	def end_record(self):
-		self._records.append(self._data)
-		self._data = {}
+		if self._pretty:
+			self._file.write(',\n' if self._nrecords else '\n')
+			self._file.write(textwrap.indent(self._dumps(self._data), '  '))
+		else:
+			self._file.write(',\n' if self._nrecords else '')
+			self._file.write(self._dumps(self._data))
+
+		self._file.flush()
+		self._nrecords += 1
+		self._data = None
+
+	def end(self):
+		if self._pretty and self._nrecords:
+			self._file.write('\n')
+		self._file.write(']')
+
+
+class JSONLinesEncoder(JSONEncoder):
+
+	APPENDABLE = True
+
+	def _dumps(self, record):
+		return json.dumps(record, sort_keys=True, separators=(',', ':'))
+
+	def begin(self):
+		self._nrecords = 0
+
+	def end_record(self):
+		self._file.write(self._dumps(self._data))
+		self._file.write('\n')
+		self._file.flush()
+		self._nrecords += 1
+		self._data = None
 
 	def end(self):
-		json.dump(self._records, self._file, sort_keys=True, indent=2)
+		pass
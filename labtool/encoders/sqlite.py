@@ -0,0 +1,202 @@
+import os, re, sqlite3
+
+from .. import parse
+
+
+DATE_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})(?:\s+(\d{1,2}):(\d{2}))?')
+
+
+def normalize_date(value):
+	if value is None:
+		return None
+
+	m = DATE_PATTERN.match(value.strip())
+	if m is None:
+		return None
+
+	day, month, year, hour, minute = m.groups()
+	date = f'{year}-{int(month):02d}-{int(day):02d}'
+	if hour is not None:
+		date += f' {int(hour):02d}:{minute}'
+	return date
+
+
+class SQLiteEncoder:
+
+	APPENDABLE = True
+	REQUIRES_FILENAME = True
+	BATCH_SIZE = 10000
+
+	REPORT_FIELDS = {
+		'Metadata/Source': 'source',
+		'Pacient/NHC': 'nhc',
+		'Peticio/ID': 'request_id',
+		'Peticio/Data': 'date',
+	}
+
+	NUMERIC_FIELDS = frozenset(parse.FIELD_MAPPING[k] for k in parse.REGULAR_FIELD_KEYS)
+
+	REFVALUE_COLUMNS = {
+		'refvalue.ge': 'refvalue_ge',
+		'refvalue.gt': 'refvalue_gt',
+		'refvalue.le': 'refvalue_le',
+		'refvalue.lt': 'refvalue_lt',
+	}
+
+	def __init__(self, filename, append=False):
+		self._filename = filename
+		self._append = append
+		self._db = None
+		self._next_id = None
+		self._report = None
+		self._fields = None
+		self._reports = []
+		self._results = []
+
+	@classmethod
+	def from_args(cls, args, file):
+		return cls(args.output, append=args.incremental is not None)
+
+	def begin(self):
+		# Like the other formats, the output is replaced unless records are being added to it
+		if not self._append:
+			for suffix in ['', '-wal', '-shm']:
+				try:
+					os.remove(self._filename + suffix)
+				except FileNotFoundError:
+					pass
+
+		self._db = sqlite3.connect(self._filename)
+		self._db.execute('PRAGMA journal_mode = WAL')
+		self._db.execute('PRAGMA synchronous = NORMAL')
+		self._db.executescript('''
+			CREATE TABLE IF NOT EXISTS reports (
+				id          INTEGER PRIMARY KEY,
+				source      TEXT,
+				nhc         TEXT,
+				request_id  TEXT,
+				date        TEXT,
+				sample_date TEXT
+			);
+			CREATE TABLE IF NOT EXISTS results (
+				report_id   INTEGER NOT NULL REFERENCES reports (id),
+				field       TEXT NOT NULL,
+				value,      -- untyped, so results stay REAL and other fields TEXT
+				qualifier   TEXT,
+				unit        TEXT,
+				refvalue_ge REAL,
+				refvalue_gt REAL,
+				refvalue_le REAL,
+				refvalue_lt REAL
+			);
+		''')
+		self._upgrade()
+		self._next_id = self._db.execute('SELECT coalesce(max(id), 0) + 1 FROM reports').fetchone()[0]
+
+	# Databases written by older versions get the missing columns and their values added
+	def _upgrade(self):
+		columns = [row[1] for row in self._db.execute('PRAGMA table_info(reports)')]
+		if 'sample_date' not in columns:
+			self._db.create_function('normalize_date', 1, normalize_date)
+			with self._db:
+				self._db.execute('ALTER TABLE reports ADD COLUMN sample_date TEXT')
+				self._db.execute('UPDATE reports SET sample_date = normalize_date(date)')
+
+		columns = [row[1] for row in self._db.execute('PRAGMA table_info(results)')]
+		if 'qualifier' not in columns:
+			self._upgrade_results()
+
+	def _parse_stored_value(self, field, value):
+		if field not in self.NUMERIC_FIELDS or not isinstance(value, str):
+			return None
+		return parse.try_parse_field_value(value)
+
+	# Values used to be stored as TEXT, which turns numbers back into strings,
+	# so the table is rebuilt with an untyped value column
+	def _upgrade_results(self):
+		def parse_value(field, value):
+			number = self._parse_stored_value(field, value)
+			return number.value if number is not None else value
+
+		def parse_qualifier(field, value):
+			number = self._parse_stored_value(field, value)
+			if number is None or number.qualifier == parse.FieldNumber.EXACT:
+				return None
+			return number.qualifier
+
+		self._db.create_function('parse_value', 2, parse_value)
+		self._db.create_function('parse_qualifier', 2, parse_qualifier)
+		self._db.executescript('''
+			BEGIN;
+			DROP INDEX IF EXISTS results_field;
+			DROP INDEX IF EXISTS results_report_id;
+			ALTER TABLE results RENAME TO results_text;
+			CREATE TABLE results (
+				report_id   INTEGER NOT NULL REFERENCES reports (id),
+				field       TEXT NOT NULL,
+				value,
+				qualifier   TEXT,
+				unit        TEXT,
+				refvalue_ge REAL,
+				refvalue_gt REAL,
+				refvalue_le REAL,
+				refvalue_lt REAL
+			);
+			INSERT INTO results
+			SELECT report_id, field, parse_value(field, value), parse_qualifier(field, value),
+			       unit, refvalue_ge, refvalue_gt, refvalue_le, refvalue_lt
+			FROM results_text;
+			DROP TABLE results_text;
+			COMMIT;
+		''')
+
+	def begin_record(self):
+		self._report = dict.fromkeys(self.REPORT_FIELDS.values())
+		self._fields = {}
+
+	def write_property(self, field, property, value):
+		if property == 'value' and field in self.REPORT_FIELDS:
+			self._report[self.REPORT_FIELDS[field]] = value
+
+		result = self._fields.get(field)
+		if result is None:
+			result = self._fields[field] = {'value': None, 'qualifier': None, 'unit': None}
+
+		if property in ('value', 'qualifier', 'unit'):
+			result[property] = value
+		elif property in self.REFVALUE_COLUMNS:
+			result[self.REFVALUE_COLUMNS[property]] = value
+
+	def end_record(self):
+		report_id = self._next_id
+		self._next_id += 1
+
+		r = self._report
+		self._reports.append((report_id, r['source'], r['nhc'], r['request_id'], r['date'], normalize_date(r['date'])))
+		for field, result in self._fields.items():
+			self._results.append((report_id, field, result['value'], result['qualifier'], result['unit'],
+			                      result.get('refvalue_ge'), result.get('refvalue_gt'),
+			                      result.get('refvalue_le'), result.get('refvalue_lt')))
+
+		if len(self._results) >= self.BATCH_SIZE:
+			self.flush()
+
+	def flush(self):
+		with self._db:
+			self._db.executemany('INSERT INTO reports VALUES (?, ?, ?, ?, ?, ?)', self._reports)
+			self._db.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self._results)
+		self._reports.clear()
+		self._results.clear()
+
+	def end(self):
+		self.flush()
+		with self._db:
+			self._db.executescript('''
+				DROP INDEX IF EXISTS reports_nhc;
+				CREATE INDEX IF NOT EXISTS reports_nhc_date ON reports (nhc, sample_date);
+				CREATE INDEX IF NOT EXISTS reports_sample_date ON reports (sample_date);
+				CREATE INDEX IF NOT EXISTS reports_request_id ON reports (request_id);
+				CREATE INDEX IF NOT EXISTS results_field ON results (field, report_id);
+				CREATE INDEX IF NOT EXISTS results_report_id ON results (report_id);
+			''')
+		self._db.close()
@@ -9,19 +9,38 @@ def make_numeric_checker(opname, limit):
 		return None
 
 	op = getattr(operator, opname)
+	lower = opname in ['gt', 'ge']
 
-	def numeric_checker(value):
-		try:
-			n = float(value)
-			return op(n, limit)
-		except ValueError:
+	def numeric_checker(value, qualifier):
+		if not isinstance(value, Number):
 			return True
 
+		# Censored values are only out of range when every value they stand for is
+		if qualifier == parse.FieldNumber.LT:
+			return value > limit if lower else True
+		if qualifier == parse.FieldNumber.GT:
+			return True if lower else value < limit
+
+		return op(value, limit)
+
 	return numeric_checker
 
 
+def format_value(value, qualifier, text=None):
+	if not isinstance(value, Number):
+		return value
+
+	# Numbers are shown as the report printed them, keeping their precision
+	if text is None:
+		text = f'{value:.10g}'
+	if qualifier in [parse.FieldNumber.LT, parse.FieldNumber.GT]:
+		text = qualifier + text
+	return text
+
+
 class TabEncoder:
 
+	APPENDABLE = True
 	FIELD_MAXWIDTH = max(map(len, parse.FIELD_MAPPING.values()))
 	VALUE_MAXWIDTH = 12
 	UNIT_MAXWIDTH = max(map(len, parse.KNOWN_UNITS))
@@ -41,6 +60,8 @@ class TabEncoder:
 	def _set_field(self, field):
 		self._field = field
 		self._value = None
+		self._qualifier = None
+		self._text = None
 		self._unit = None
 		self._checkers.clear()
 
@@ -48,13 +69,13 @@ class TabEncoder:
 		if self._field == None or self._value == None:
 			return
 
-		if all(check(self._value) for check in self._checkers):
+		if all(check(self._value, self._qualifier) for check in self._checkers):
 			print(' ', end='', file=self._file)
 		else:
 			print('*', end='', file=self._file)
 
 		print(f' {self._field:{self.FIELD_MAXWIDTH}s}', end='', file=self._file)
-		print(f' {self._value:{self.VALUE_MAXWIDTH}s}', end='', file=self._file)
+		print(f' {format_value(self._value, self._qualifier, self._text):{self.VALUE_MAXWIDTH}s}', end='', file=self._file)
 		print(f' {self._unit or "":{self.UNIT_MAXWIDTH}s}', end='', file=self._file)
 		print(file=self._file)
 
@@ -66,6 +87,10 @@ class TabEncoder:
 
 		if property == 'value':
 			self._value = value
+		elif property == 'qualifier':
+			self._qualifier = value
+		elif property == 'text':
+			self._text = value
 		elif property == 'unit':
 			self._unit = value
 		elif property.startswith('refvalue'):
@@ -74,7 +99,10 @@ class TabEncoder:
 			self._checkers.append(checker)
 
 	def end_record(self):
+		self._output_field()
+		self._set_field(None)
 		print(file=self._file)
+		self._file.flush()
 
 	def end(self):
 		pass
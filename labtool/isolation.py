@@ -0,0 +1,189 @@
+import multiprocessing, os, threading, time
+
+from collections                import deque
+from concurrent.futures         import Future
+from multiprocessing.connection import wait
+
+from labtool.batch              import WorkerKilled, parse_failed
+
+
+POLL_INTERVAL = 0.1
+
+
+def process_rss(pid):
+	# Only Linux exposes this cheaply; elsewhere memory limits are not enforced
+	try:
+		with open(f'/proc/{pid}/statm') as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (OSError, ValueError, IndexError):
+		return None
+
+
+def worker_main(conn):
+	while True:
+		task = conn.recv()
+		if task is None:
+			break
+
+		fn, args, kwargs = task
+		try:
+			result = True, fn(*args, **kwargs)
+		except Exception as e:
+			result = False, e
+
+		try:
+			conn.send(result)
+		except Exception as e:
+			# The exception raised by the task may not be picklable
+			conn.send((False, RuntimeError(f'{type(e).__name__}: {e}')))
+
+
+class Worker:
+
+	def __init__(self, context):
+		self.conn, child_conn = context.Pipe()
+		self.process = context.Process(target=worker_main, args=(child_conn,), daemon=True)
+		self.process.start()
+		child_conn.close()
+		self.future = None
+		self.deadline = None
+
+	def assign(self, future, task, timeout):
+		self.future = future
+		self.deadline = time.monotonic() + timeout if timeout is not None else None
+		self.conn.send(task)
+
+	def release(self):
+		future, self.future, self.deadline = self.future, None, None
+		return future
+
+	def kill(self):
+		self.process.kill()
+		self.process.join()
+		self.conn.close()
+
+
+class IsolatedExecutor:
+
+	def __init__(self, max_workers, timeout=None, max_memory=None):
+		self._context = multiprocessing.get_context()
+		self._workers = [Worker(self._context) for _ in range(max_workers)]
+		self._timeout = timeout
+		self._max_memory = max_memory
+		self._pending = deque()
+		self._lock = threading.Lock()
+		self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+		self._shutdown = False
+		self._thread = threading.Thread(target=self._dispatch, daemon=True)
+		self._thread.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.shutdown()
+
+	def submit(self, fn, *args, **kwargs):
+		future = Future()
+		with self._lock:
+			self._pending.append((future, (fn, args, kwargs)))
+		self._wakeup_writer.send_bytes(b'')
+		return future
+
+	def shutdown(self, wait=True):
+		with self._lock:
+			self._shutdown = True
+		self._wakeup_writer.send_bytes(b'')
+		if wait:
+			self._thread.join()
+
+	def _respawn(self, worker):
+		worker.kill()
+		replacement = Worker(self._context)
+		self._workers[self._workers.index(worker)] = replacement
+		return replacement
+
+	def _replace(self, worker, error):
+		future = worker.release()
+		self._respawn(worker)
+		future.set_exception(error)
+
+	def _assign_pending(self):
+		for worker in list(self._workers):
+			if worker.future is not None:
+				continue
+
+			# Idle workers may be killed too, e.g. by the OOM killer in a long-running server
+			if not worker.process.is_alive():
+				worker = self._respawn(worker)
+
+			with self._lock:
+				if not self._pending:
+					return
+				future, task = self._pending.popleft()
+
+			if not future.set_running_or_notify_cancel():
+				continue
+
+			try:
+				worker.assign(future, task, self._timeout)
+			except OSError:
+				self._replace(worker, WorkerKilled('crashed', f'exit code {worker.process.exitcode}'))
+			except Exception as e:
+				# The task could not be pickled, which leaves the worker as it was
+				worker.release().set_exception(e)
+
+	def _enforce_limits(self):
+		now = time.monotonic()
+		for worker in self._workers:
+			if worker.future is None:
+				continue
+
+			if worker.deadline is not None and now > worker.deadline:
+				self._replace(worker, WorkerKilled('timeout', f'exceeded {self._timeout:g} s'))
+				continue
+
+			if self._max_memory is not None:
+				rss = process_rss(worker.process.pid)
+				if rss is not None and rss > self._max_memory:
+					self._replace(worker, WorkerKilled('memory', f'reached {rss / 2**20:.0f} MB'))
+
+	def _dispatch(self):
+		while True:
+			self._assign_pending()
+
+			busy = [w for w in self._workers if w.future is not None]
+			with self._lock:
+				if self._shutdown and not busy and not self._pending:
+					break
+
+			ready = wait([self._wakeup_reader] + [w.conn for w in busy] + [w.process.sentinel for w in busy],
+			             timeout=POLL_INTERVAL)
+
+			while self._wakeup_reader.poll():
+				self._wakeup_reader.recv_bytes()
+
+			for worker in busy:
+				if worker.conn in ready:
+					try:
+						ok, value = worker.conn.recv()
+					except EOFError:
+						self._replace(worker, WorkerKilled('crashed', f'exit code {worker.process.exitcode}'))
+						continue
+
+					future = worker.release()
+					if ok:
+						future.set_result(value)
+					else:
+						future.set_exception(parse_failed(value))
+
+				elif worker.process.sentinel in ready:
+					worker.process.join()
+					self._replace(worker, WorkerKilled('crashed', f'exit code {worker.process.exitcode}'))
+
+			self._enforce_limits()
+
+		for worker in self._workers:
+			worker.conn.send(None)
+			worker.process.join()
+			worker.conn.close()
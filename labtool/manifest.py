@@ -0,0 +1,72 @@
+import os, sqlite3
+
+from labtool.cache import file_digest
+
+
+class Manifest:
+
+	COMMIT_INTERVAL = 64
+
+	def __init__(self, filename):
+		self._db = sqlite3.connect(filename)
+		self._db.execute('PRAGMA journal_mode = WAL')
+		self._db.execute('PRAGMA synchronous = NORMAL')
+		self._db.execute('''
+			CREATE TABLE IF NOT EXISTS files (
+				path   TEXT PRIMARY KEY,
+				size   INTEGER NOT NULL,
+				mtime  INTEGER NOT NULL,
+				digest TEXT NOT NULL
+			)''')
+		self.unchanged = 0
+		self.changed = 0
+		self._pending = []
+
+	def is_changed(self, path):
+		try:
+			st = os.stat(path)
+		except OSError:
+			return True
+
+		row = self._db.execute('SELECT size, mtime, digest FROM files WHERE path = ?',
+		                       (os.path.abspath(path),)).fetchone()
+		if row is None:
+			return True
+
+		size, mtime, digest = row
+		if size == st.st_size and mtime == st.st_mtime_ns:
+			return False
+
+		# Touched but identical files only need their stat info refreshed
+		if size == st.st_size and digest == file_digest(path):
+			self._db.execute('UPDATE files SET mtime = ? WHERE path = ?', (st.st_mtime_ns, os.path.abspath(path)))
+			return False
+
+		return True
+
+	def changed_files(self, paths):
+		for path in paths:
+			if self.is_changed(path):
+				self.changed += 1
+				yield path
+			else:
+				self.unchanged += 1
+
+	# Recorded files are only written on commit, which callers do once their output is safe
+	def record(self, path, digest=None):
+		st = os.stat(path)
+		if digest is None:
+			digest = file_digest(path)
+		self._pending.append((os.path.abspath(path), st.st_size, st.st_mtime_ns, digest))
+
+	@property
+	def pending(self):
+		return len(self._pending)
+
+	def commit(self):
+		self._db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', self._pending)
+		self._db.commit()
+		self._pending.clear()
+
+	def close(self):
+		self._db.close()
@@ -1,10 +1,14 @@
-import re
+import re, sys
 
-from dataclasses import dataclass
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from operator import attrgetter
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTItem, LTTextBoxHorizontal
 
+from labtool.profiling import null_stage
+
+
+PARSER_VERSION  = 5
 
 POSITION_LEFT   = 0
 POSITION_BOTTOM = 1
@@ -15,6 +19,28 @@ LINE_HEIGHT     = 10
 ITEM_VPADDING   = 10
 ITEM_VTOLERANCY = 5
 
+# Same meaning as the LAParams margins, in multiples of the character size
+HEADER_CHAR_MARGIN = 2.0
+HEADER_WORD_MARGIN = 0.1
+
+# Keyword arguments of pdfminer's LAParams for each engine
+EXTRACTION_ENGINES = {
+
+	# Full pdfminer layout analysis, including text box grouping and reading order
+	'default': {},
+
+	# Only lines and text boxes are built, as parse_lab sorts items by itself
+	'fast': {'boxes_flow': None},
+
+}
+
+# Keyword options of parse_lab that change its output, with their defaults
+PARSE_OPTIONS = {
+	'engine': 'default',
+	'max_pages': 0,
+	'prefilter': True,
+}
+
 STANDALONE_FIELDS = [
 	'CIP',
 	'Data obtencio mostra',
@@ -32,6 +58,20 @@ STANDALONE_FIELDS = [
 	'Unitat de tractament',
 ]
 
+FIELD_PREFIXES = [
+	'Ers(San)',
+	'Gas(vSan)',
+	'Hb(San)',
+	'Hb(vSan)',
+	'Lks(San)',
+	'Pac(vSan)',
+	'Pla',
+	'Ren',
+	'San',
+	'Srm',
+	'vPla',
+]
+
 FIELD_MAPPING = {
 
 	# Standalone Fields
@@ -74,7 +114,6 @@ FIELD_MAPPING = {
 	'Pla-Bilirubina;c.subst.': 'Serum/Bilirrubina',
 	'Pla-Calci(II);c.subst.': 'Serum/Calci',
 	'Pla-Clorur;c.subst.': 'Serum/Clorur',
-	'Pla-Coagulacio induida per factor tissular;INR(temps de': 'Plasma/INR',
 	'Pla-Coagulacio induida per factor tissular;INR(temps': 'Plasma/INR',
 	'Pla-Coagulacio induida per factor tissular;temps rel.(temps': 'Plasma/TP',
 	'Pla-Coagulacio induida per una superficie;temps rel.(TTPA)': 'Plasma/TTPA',
@@ -164,6 +203,10 @@ FIELD_MAPPING = {
 
 }
 
+METADATA_FIELDS = [
+	'Metadata/Source',
+]
+
 DUAL_FIELDS = [
 	'Serum/Colesterol',
 	'Serum/Glucosa',
@@ -202,13 +245,56 @@ KNOWN_UNITS = [
 ]
 
 
+WHITESPACE_PATTERN = re.compile(r'[ \t]+')
+SPACING_PATTERN    = re.compile(r' (?=[;\(])|(?<=[.;\)]) ')
+QUOTING_PATTERN    = re.compile(r'(?<=[-;\(\)])[\'"]|[\'"](?=[-;\(\)])')
+
+CHARACTER_FOLDING = str.maketrans({
+	'—': '-',
+	'à': 'a',
+	'ú': 'u',
+	'`': "'",
+	'´': "'",
+	'è': 'e',
+	'é': 'e',
+	'í': 'i',
+	'ï': 'i',
+	'ò': 'o',
+	'ó': 'o',
+})
+
+LINE_STANDALONE = 'standalone'
+LINE_REGULAR    = 'regular'
+LINE_VALUE      = 'value'
+
+
+def make_alternation(strings):
+	return '|'.join(re.escape(s) for s in sorted(strings, key=len, reverse=True))
+
+
+REGULAR_FIELD_KEYS = [k for k in FIELD_MAPPING if k.startswith(tuple(f'{p}-' for p in FIELD_PREFIXES))]
+
+LINE_CLASSIFIER = re.compile(
+	f'(?P<{LINE_STANDALONE}>{make_alternation(STANDALONE_FIELDS)}):|'
+	f'(?=(?P<key>{make_alternation(REGULAR_FIELD_KEYS)})?)(?P<{LINE_REGULAR}>{make_alternation(FIELD_PREFIXES)})-'
+)
+
+# Matched against the raw character stream of a page, which has no layout spacing yet
+PAGE_FIELD_MARKERS = re.compile(
+	'|'.join(re.escape(''.join(s.split())) for s in
+	         [f'{f}:' for f in STANDALONE_FIELDS] + [f'{p}-' for p in FIELD_PREFIXES])
+)
+
+
 @dataclass
 class Field:
 
+	__slots__ = ('name', '_data')
+
 	name: str
 
 	def __init__(self, name):
-		self.name = name
+		self.name = sys.intern(name)
 		self._data = []
 
 	def add_data(self, data):
@@ -219,8 +305,19 @@ class Field:
 			fdata.encode(encode)
 
 
+class FieldData:
+
+	__slots__ = ()
+
+	# Frozen slotted instances can't be restored through setattr, so pickle by value
+	def __reduce__(self):
+		return type(self), tuple(getattr(self, f.name) for f in fields(self))
+
+
 @dataclass(frozen=True)
-class FieldValue:
+class FieldValue(FieldData):
+
+	__slots__ = ('value',)
 
 	value: str
 
@@ -229,7 +326,31 @@ class FieldValue:
 
 
 @dataclass(frozen=True)
-class FieldUnit:
+class FieldNumber(FieldValue):
+
+	EXACT   = '='
+	GT      = '>'
+	LT      = '<'
+	PENDING = 'pending'
+
+	__slots__ = ('qualifier', 'text')
+
+	value: float
+	qualifier: str
+	# As printed on the report, e.g. '7.40', for output meant to be read by people
+	text: str
+
+	def encode(self, encode):
+		encode('value', self.value)
+		if self.qualifier != self.EXACT:
+			encode('qualifier', self.qualifier)
+		encode('text', self.text)
+
+
+@dataclass(frozen=True)
+class FieldUnit(FieldData):
+
+	__slots__ = ('unit',)
 
 	unit: str
 
@@ -237,13 +358,16 @@ class FieldUnit:
 		encode('unit', self.unit)
 
 
-class FieldRefValues:
-	pass
+class FieldRefValues(FieldData):
+
+	__slots__ = ()
 
 
 @dataclass(frozen=True)
 class TwoSidedRefValueInterval(FieldRefValues):
 
+	__slots__ = ('min', 'max')
+
 	min: float
 	max: float
 
@@ -260,6 +384,8 @@ class OneSidedRefValueInterval(FieldRefValues):
 	LE = '≤'
 	LT = '<'
 
+	__slots__ = ('sign', 'limit')
+
 	sign: str
 	limit: float
 
@@ -277,7 +403,9 @@ class OneSidedRefValueInterval(FieldRefValues):
 
 
 @dataclass(frozen=True)
-class FieldText:
+class FieldText(FieldData):
+
+	__slots__ = ('text',)
 
 	text: str
 
@@ -285,45 +413,52 @@ class FieldText:
 		pass
 
 
+def qualifier_column(name):
+	return f'{name}.qualifier'
+
+
 def make_field(name, value):
 	field = Field(name)
 	field.add_data(FieldValue(value))
 	return field
 
 
+@lru_cache(maxsize=4096)
 def normalize_string(s):
 
 	# Coalesce whitespace
-	s = re.sub(r'[ \t]+', ' ', s)
+	s = WHITESPACE_PATTERN.sub(' ', s)
 
 	# Fix inconsistent whitespace
-	s = re.sub(r' ([;\(])', r'\1', s)
-	s = re.sub(r'([.;\)]) ', r'\1', s)
+	s = SPACING_PATTERN.sub('', s)
 
 	# Fix inconsistent quoting
-	s = re.sub(r'([-;\(\)])[\'"]', r'\1', s)
-	s = re.sub(r'[\'"]([-;\(\)])', r'\1', s)
+	s = QUOTING_PATTERN.sub('', s)
 
 	# Replace unicode characters with ASCII equivalents
-	s = s.replace('—', '-')
-	s = s.replace('à', 'a')
-	s = s.replace('ú', 'u')
-	s = re.sub('[`´]', "'", s)
-	s = re.sub('[èé]', 'e', s)
-	s = re.sub('[íï]', 'i', s)
-	s = re.sub('[òó]', 'o', s)
+	s = s.translate(CHARACTER_FOLDING)
 
 	return s.strip()
 
 
+def classify_line(content):
+	match = LINE_CLASSIFIER.match(content)
+	if match is None:
+		return LINE_VALUE, None, None
+
+	if match.lastgroup == LINE_STANDALONE:
+		prefix = match[LINE_STANDALONE]
+		return LINE_STANDALONE, prefix, prefix if prefix in FIELD_MAPPING else None
+
+	return LINE_REGULAR, match[LINE_REGULAR], match['key']
+
+
 def is_standalone_field(content):
-	for m in STANDALONE_FIELDS:
-		if content.startswith(f'{m}:'):
-			return True
-	return False
+	kind, _, _ = classify_line(content)
+	return kind == LINE_STANDALONE
 
 
-def parse_standalone_field(content, item):
+def parse_standalone_field(content, position):
 	key_value = content.split(':')
 	if len(key_value) != 2:
 		return None
@@ -337,37 +472,45 @@ def parse_standalone_field(content, item):
 
 
 def is_regular_field(content):
+	kind, _, _ = classify_line(content)
+	return kind == LINE_REGULAR
 
-	FIELD_PREFIXES = [
-		'Ers(San)',
-		'Gas(vSan)',
-		'Hb(San)',
-		'Hb(vSan)',
-		'Lks(San)',
-		'Pac(vSan)',
-		'Pla',
-		'Ren',
-		'San',
-		'Srm',
-		'vPla',
-	]
 
-	for m in FIELD_PREFIXES:
-		if content.startswith(f'{m}-'):
-			return True
+def apply_field_mapping(key):
+	name = FIELD_MAPPING.get(key)
+	if name is not None:
+		return name
 
-	return False
+	# Line-wrapped names are matched by their longest known prefix
+	match = LINE_CLASSIFIER.match(key)
+	if match is not None and match['key'] is not None:
+		return FIELD_MAPPING[match['key']]
 
+	return key
 
-def apply_field_mapping(key):
-	return FIELD_MAPPING.get(key, key)
+
+class ValueItemIndex:
+
+	def __init__(self, items):
+		self._items = sorted(items, key=lambda c_p: item_ordering(c_p[1]))
+		self._keys = [-pos[POSITION_TOP] for _, pos in self._items]
+		self._start = 0
+
+	def find(self, low, high):
+		first = bisect_left(self._keys, -high, self._start)
+		last = bisect_right(self._keys, -low, self._start)
+		return self._items[first:last]
+
+	def consume(self, count):
+		self._start = min(self._start + count, len(self._items))
 
 
 def find_field_related_items(limits, available):
 	related = []
 
+	# Candidates are looked up with some slack, the exact bounds are checked below
 	left, bottom, _, top = limits
-	for (content, pos) in available:
+	for (content, pos) in available.find(bottom - ITEM_VTOLERANCY - 1, top + ITEM_VTOLERANCY + 1):
 		if pos == limits:
 			continue
 
@@ -394,19 +537,23 @@ def get_item_content(item):
 
 
 def try_parse_field_value(content):
-	result = re.match(r'(?:\*\s+)?([<>]?\d+(?:\.\d+)?)', content)
+	result = re.match(r'(?:\*\s+)?([<>]?)(\d+(?:\.\d+)?)', content)
 	if result is not None:
-		return FieldValue(value=result[1])
+		return FieldNumber(value=float(result[2]),
+		                   qualifier=result[1] or FieldNumber.EXACT,
+		                   text=result[2])
 
 	if content in ['Pendent', '----']:
-		return FieldValue(value=None)
+		return FieldNumber(value=None,
+		                   qualifier=FieldNumber.PENDING,
+		                   text=content)
 
 	return None
 
 
 def try_parse_field_unit(content):
 	if content in KNOWN_UNITS:
-		return FieldUnit(unit=content)
+		return FieldUnit(unit=sys.intern(content))
 
 	return None
 
@@ -460,8 +607,6 @@ def parse_fields_while(condition, available):
 
 
 def parse_field_related_item_set(available):
-	assert(available == sorted(available, key=lambda c_p: item_ordering(c_p[1])))
-
 	not_field_value = lambda x: not isinstance(x, FieldValue)
 	related  = parse_fields_while(not_field_value, available)
 	related += parse_fields_while(not_field_value, available[len(related):])
@@ -473,29 +618,70 @@ def parse_field_related_item_set(available):
 
 
 def parse_regular_field(name, limits, available):
-	assert(available == sorted(available, key=lambda c_i: item_ordering(c_i[1])))
-
 	field = Field(apply_field_mapping(name))
 
 	related = find_field_related_items(limits, available)
 	included = parse_field_related_item_set(related)
 	for fdata in included:
-		field.add_data(fdata)
+		if not isinstance(fdata, FieldText):
+			field.add_data(fdata)
 
 	skipped = []
 	if field.name in DUAL_FIELDS:
 		skipped = parse_field_related_item_set(related[len(included):])
 
-	return field, available[len(included) + len(skipped):]
+	available.consume(len(included) + len(skipped))
+	return field
+
+
+# pdfminer is only imported once a report is read, which keeps CLI startup fast
+@lru_cache(None)
+def layout_params(engine):
+	from pdfminer.layout import LAParams
+	return LAParams(**EXTRACTION_ENGINES[engine])
+
+
+def page_may_contain_fields(page):
+	from pdfminer.layout import LTChar
+
+	text = ''.join(item.get_text() for item in page if isinstance(item, LTChar))
+	text = ''.join(text.translate(CHARACTER_FOLDING).split())
+	return PAGE_FIELD_MARKERS.search(text) is not None
+
+
+def read_raw_pages(f, max_pages=0):
+	from pdfminer.converter import PDFPageAggregator
+	from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+	from pdfminer.pdfpage import PDFPage
+
+	# Pages are interpreted without layout analysis, which callers run when needed
+	resources = PDFResourceManager()
+	device = PDFPageAggregator(resources, laparams=None)
+	interpreter = PDFPageInterpreter(resources, device)
+
+	for page in PDFPage.get_pages(f, maxpages=max_pages):
+		interpreter.process_page(page)
+		yield device.get_result()
 
-def parse_lab(f):
-	data = {}
 
-	for page in extract_pages(f):
-		field_items = []
-		value_items = []
+def extract_page_items(f, engine='default', max_pages=0, prefilter=True, counters=None):
+	from pdfminer.layout import LTTextBoxHorizontal
 
-		for item in page:
+	laparams = layout_params(engine)
+
+	for layout in read_raw_pages(f, max_pages):
+		if counters is not None:
+			counters['pages'] += 1
+
+		if prefilter and not page_may_contain_fields(layout):
+			if counters is not None:
+				counters['pages_skipped'] += 1
+			continue
+
+		layout.analyze(laparams)
+		items = []
+
+		for item in layout:
 			if not isinstance(item, LTTextBoxHorizontal):
 				continue
 
@@ -507,27 +693,104 @@ def parse_lab(f):
 
 				position = list(item.bbox)
 				position[POSITION_TOP] -= nline * LINE_HEIGHT
+				items.append((content, position))
+
+		yield items
+
+
+def split_raw_lines(page):
+	from pdfminer.layout import LTChar
+
+	rows = {}
+	for item in page:
+		if isinstance(item, LTChar):
+			# Characters on a line share the baseline of their text matrix, whatever their font
+			rows.setdefault(round(item.matrix[5]), []).append(item)
+
+	for baseline in sorted(rows, reverse=True):
+		chars = sorted(rows[baseline], key=attrgetter('x0'))
+		segment = chars[0].get_text()
+		for prev, char in zip(chars, chars[1:]):
+			gap = char.x0 - prev.x1
+			size = max(prev.width, prev.height)
+			if gap > HEADER_CHAR_MARGIN * size:
+				yield segment
+				segment = ''
+			elif gap > HEADER_WORD_MARGIN * size:
+				segment += ' '
+			segment += char.get_text()
+		yield segment
+
+
+def extract_header_fields(f):
+	header = {}
+	for page in read_raw_pages(f, max_pages=1):
+		for content in split_raw_lines(page):
+			content = normalize_string(content)
+			kind, _, _ = classify_line(content)
+			if kind != LINE_STANDALONE:
+				continue
+
+			field = parse_standalone_field(content, None)
+			if field is not None:
+				header.setdefault(field.name, field._data[0].value)
+
+	return header
+
+
+def classify_page_items(items):
+	standalone_fields = []
+	field_items = []
+	value_items = []
+
+	for content, position in items:
+		kind, _, key = classify_line(content)
+		if kind == LINE_STANDALONE:
+			field = parse_standalone_field(content, position)
+			if field is not None:
+				standalone_fields.append(field)
+		elif kind == LINE_REGULAR:
+			field_items.append((key or content, position))
+		else:
+			value_items.append((content, position))
 
-				if is_standalone_field(content):
-					field = parse_standalone_field(content, item)
-					if field is not None and field.name not in data:
-						data[field.name] = field
-				elif is_regular_field(content):
-					field_items.append((content, position))
-				else:
-					value_items.append((content, position))
+	return standalone_fields, field_items, value_items
 
-		field_ordering = lambda n_p: item_ordering(n_p[1])
-		field_items = sorted(field_items, key=field_ordering)
-		value_items = sorted(value_items, key=field_ordering)
 
-		for i, (name, pos) in enumerate(field_items):
-			if i < len(field_items) - 1:
-				_, next_pos = field_items[i+1]
-				pos[POSITION_BOTTOM] = next_pos[POSITION_TOP] + ITEM_VPADDING
+def assemble_regular_fields(field_items, value_items):
+	fields = []
+
+	field_ordering = lambda n_p: item_ordering(n_p[1])
+	field_items = sorted(field_items, key=field_ordering)
+	value_items = ValueItemIndex(value_items)
+
+	for i, (name, pos) in enumerate(field_items):
+		if i < len(field_items) - 1:
+			_, next_pos = field_items[i+1]
+			pos[POSITION_BOTTOM] = next_pos[POSITION_TOP] + ITEM_VPADDING
+
+		fields.append(parse_regular_field(name, pos, value_items))
+
+	return fields
+
+
+def parse_lab(f, engine='default', max_pages=0, prefilter=True, profiler=None, counters=None):
+	data = {}
+	stage = profiler.stage if profiler is not None else null_stage
+
+	pages = extract_page_items(f, engine, max_pages, prefilter, counters)
+	while True:
+		with stage('extract'):
+			items = next(pages, None)
+		if items is None:
+			break
 
-			field, value_items = parse_regular_field(name, pos, value_items)
+		with stage('classify'):
+			standalone_fields, field_items, value_items = classify_page_items(items)
+		with stage('assemble'):
+			regular_fields = assemble_regular_fields(field_items, value_items)
 
+		for field in standalone_fields + regular_fields:
 			if field.name in data:
 				continue
 
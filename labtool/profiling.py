@@ -0,0 +1,115 @@
+import json, math, threading, time
+
+from collections import Counter, deque
+from contextlib  import contextmanager, nullcontext
+
+
+def null_stage(name):
+	return nullcontext()
+
+
+class StageProfiler:
+
+	def __init__(self):
+		self.wall = Counter()
+		self.cpu = Counter()
+		self.calls = Counter()
+
+	@contextmanager
+	def stage(self, name):
+		wall, cpu = time.perf_counter(), time.process_time()
+		try:
+			yield
+		finally:
+			self.wall[name] += time.perf_counter() - wall
+			self.cpu[name] += time.process_time() - cpu
+			self.calls[name] += 1
+
+	def merge(self, other):
+		self.wall.update(other.wall)
+		self.cpu.update(other.cpu)
+		self.calls.update(other.calls)
+
+	def total(self):
+		return sum(self.wall.values())
+
+	def as_dict(self):
+		return {name: {'wall': self.wall[name], 'cpu': self.cpu[name], 'calls': self.calls[name]} for name in self.wall}
+
+
+class BatchProfiler:
+
+	def __init__(self):
+		self.files = {}
+
+	def file(self, path):
+		profiler = self.files.get(path)
+		if profiler is None:
+			profiler = self.files[path] = StageProfiler()
+		return profiler
+
+	@contextmanager
+	def stage(self, path, name):
+		with self.file(path).stage(name):
+			yield
+
+	def slowest_files(self, count):
+		return sorted(self.files.items(), key=lambda p_s: p_s[1].total(), reverse=True)[:count]
+
+	def summarize(self):
+		stages = StageProfiler()
+		for profiler in self.files.values():
+			stages.merge(profiler)
+		return stages
+
+	def print_summary(self, file, top=10):
+		stages = self.summarize()
+		total = stages.total() or 1
+
+		print(f'{"Stage":12s} {"Calls":>8s} {"Wall (s)":>10s} {"CPU (s)":>10s} {"Wall %":>7s}', file=file)
+		for name, wall in stages.wall.most_common():
+			print(f'{name:12s} {stages.calls[name]:8d} {wall:10.3f} {stages.cpu[name]:10.3f} {100 * wall / total:6.1f}%', file=file)
+
+		if top > 0 and self.files:
+			print(file=file)
+			print(f'Slowest {min(top, len(self.files))} files:', file=file)
+			for path, profiler in self.slowest_files(top):
+				print(f'{profiler.total():10.3f} s  {path}', file=file)
+
+	def write_json(self, file):
+		json.dump({
+			'stages': self.summarize().as_dict(),
+			'files': {path: profiler.as_dict() for path, profiler in self.files.items()},
+		}, file, indent=2)
+
+
+def percentile(values, q):
+	if not values:
+		return None
+
+	# Nearest-rank percentile over sorted values
+	return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class LatencyRecorder:
+
+	PERCENTILES = [50, 90, 99]
+
+	def __init__(self, window=10000):
+		self._latencies = deque(maxlen=window)
+		self._lock = threading.Lock()
+		self.count = 0
+
+	def record(self, seconds):
+		with self._lock:
+			self._latencies.append(seconds)
+			self.count += 1
+
+	def as_dict(self):
+		with self._lock:
+			values = sorted(self._latencies)
+
+		summary = {f'p{q}': percentile(values, q) for q in self.PERCENTILES}
+		summary['max'] = values[-1] if values else None
+		summary['window'] = len(values)
+		return summary
@@ -0,0 +1,179 @@
+import json, os, sys, threading, time
+
+from collections import Counter, deque
+
+
+FILE_STATUSES = ['parsed', 'skipped', 'failed', 'quarantined']
+
+# Rates are measured over this many seconds, so a slowdown shows up quickly
+RATE_WINDOW = 60
+
+
+def format_duration(seconds):
+	seconds = int(seconds)
+	if seconds >= 3600:
+		return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+	if seconds >= 60:
+		return f'{seconds // 60}m{seconds % 60:02d}s'
+	return f'{seconds}s'
+
+
+def write_atomically(filename, text):
+	# Readers such as the node exporter must never see a half-written file
+	temporary = f'{filename}.{os.getpid()}.tmp'
+	with open(temporary, 'w', encoding='utf-8') as f:
+		f.write(text)
+	os.replace(temporary, filename)
+
+
+class BatchMetrics:
+
+	def __init__(self, prefetcher=None, counters=None):
+		self.started = time.time()
+		self.files = Counter()
+		self.fields = 0
+		self.discovered = 0
+		self.discovery_done = False
+		self._prefetcher = prefetcher
+		self._counters = counters
+		self._samples = deque([(self.started, 0, 0)])
+		self._lock = threading.Lock()
+
+	def discover(self, paths):
+		for path in paths:
+			self.discovered += 1
+			yield path
+		self.discovery_done = True
+
+	def file_done(self, status, fields=0):
+		with self._lock:
+			self.files[status] += 1
+			self.fields += fields
+
+	def snapshot(self):
+		now = time.time()
+		with self._lock:
+			files = {status: self.files[status] for status in FILE_STATUSES}
+			fields = self.fields
+
+		done = sum(files.values())
+		pages = self._counters['pages'] if self._counters is not None else 0
+
+		self._samples.append((now, done, pages))
+		while len(self._samples) > 2 and now - self._samples[1][0] >= RATE_WINDOW:
+			self._samples.popleft()
+
+		since, done_before, pages_before = self._samples[0]
+		elapsed = now - since
+		files_rate = (done - done_before) / elapsed if elapsed > 0 else 0.0
+		pages_rate = (pages - pages_before) / elapsed if elapsed > 0 else 0.0
+
+		# Files are found while the batch runs, so the total is only known once discovery ends
+		eta = None
+		if self.discovery_done and files_rate > 0:
+			eta = (self.discovered - done) / files_rate
+
+		return {
+			'started': self.started,
+			'updated': now,
+			'elapsed': now - self.started,
+			'files': files,
+			'files_done': done,
+			'files_discovered': self.discovered,
+			'discovery_done': self.discovery_done,
+			'pages': pages,
+			'fields': fields,
+			'bytes_read': self._prefetcher.bytes if self._prefetcher is not None else 0,
+			'files_per_second': files_rate,
+			'pages_per_second': pages_rate,
+			'eta': eta,
+		}
+
+
+def format_progress(status):
+	total = f'{status["files_discovered"]}' + ('' if status['discovery_done'] else '+')
+	files = ', '.join(f'{n} {name}' for name, n in status['files'].items() if n or name == 'parsed')
+	eta = format_duration(status['eta']) if status['eta'] is not None else '?'
+	return (f'{status["files_done"]}/{total} files ({files}), '
+	        f'{status["files_per_second"]:.1f} files/s, {status["pages_per_second"]:.1f} pages/s, '
+	        f'{status["bytes_read"] / 2**20:.1f} MB read, ETA {eta}')
+
+
+def format_prometheus(status, running):
+	metrics = [
+		('labtool_batch_running', 'gauge', 'Whether the batch is still running', [('', int(running))]),
+		('labtool_batch_start_time_seconds', 'gauge', 'Unix time the batch started at', [('', status['started'])]),
+		('labtool_batch_last_update_seconds', 'gauge', 'Unix time these metrics were written at', [('', status['updated'])]),
+		('labtool_batch_files_total', 'counter', 'Files processed, by outcome',
+		 [(f'{{status="{name}"}}', n) for name, n in status['files'].items()]),
+		('labtool_batch_files_discovered', 'gauge', 'Files found so far', [('', status['files_discovered'])]),
+		('labtool_batch_pages_total', 'counter', 'Pages read', [('', status['pages'])]),
+		('labtool_batch_fields_total', 'counter', 'Fields extracted', [('', status['fields'])]),
+		('labtool_batch_read_bytes_total', 'counter', 'Bytes of report files read', [('', status['bytes_read'])]),
+		('labtool_batch_files_per_second', 'gauge', f'Files processed per second over the last {RATE_WINDOW} s', [('', status['files_per_second'])]),
+		('labtool_batch_pages_per_second', 'gauge', f'Pages read per second over the last {RATE_WINDOW} s', [('', status['pages_per_second'])]),
+	]
+	if status['eta'] is not None:
+		metrics.append(('labtool_batch_eta_seconds', 'gauge', 'Estimated seconds until the batch ends', [('', status['eta'])]))
+
+	lines = []
+	for name, kind, help, samples in metrics:
+		lines.append(f'# HELP {name} {help}')
+		lines.append(f'# TYPE {name} {kind}')
+		lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+	return '\n'.join(lines) + '\n'
+
+
+class MetricsReporter:
+
+	# The progress line on a terminal is redrawn at this rate, whatever the interval
+	TERMINAL_REFRESH = 1.0
+
+	def __init__(self, metrics, interval=10.0, progress=None, prometheus_file=None, status_file=None):
+		self.metrics = metrics
+		self.interval = interval
+		self._progress = progress
+		self._prometheus_file = prometheus_file
+		self._status_file = status_file
+		self._terminal = progress is not None and progress.isatty()
+		self._stopped = threading.Event()
+		self._thread = threading.Thread(target=self._run, daemon=True)
+
+	def start(self):
+		self._thread.start()
+
+	def stop(self):
+		self._stopped.set()
+		if self._thread.is_alive():
+			self._thread.join()
+		self.report(running=False)
+
+	def report(self, running=True, write_files=True):
+		status = self.metrics.snapshot()
+
+		if self._progress is not None and (self._terminal or write_files):
+			line = format_progress(status)
+			if self._terminal:
+				# Redrawn in place, and left on screen once the batch ends
+				print(f'\r\033[K{line}', end='' if running else '\n', file=self._progress, flush=True)
+			else:
+				print(line, file=self._progress, flush=True)
+
+		if not write_files:
+			return
+
+		try:
+			if self._prometheus_file is not None:
+				write_atomically(self._prometheus_file, format_prometheus(status, running))
+			if self._status_file is not None:
+				write_atomically(self._status_file, json.dumps({**status, 'running': running}, indent=2, sort_keys=True) + '\n')
+		except OSError as e:
+			print(f'Error writing metrics: {e}', file=sys.stderr)
+
+	def _run(self):
+		tick = min(self.interval, self.TERMINAL_REFRESH) if self._terminal else self.interval
+		every = max(1, round(self.interval / tick))
+		ticks = 0
+		while not self._stopped.wait(tick):
+			ticks += 1
+			self.report(write_files=ticks % every == 0)
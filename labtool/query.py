@@ -0,0 +1,74 @@
+import os, re, sqlite3
+
+from datetime                import datetime, timedelta
+
+from labtool.encoders.sqlite import normalize_date
+
+
+QUERY_COLUMNS = ['sample_date', 'nhc', 'field', 'value', 'qualifier', 'unit', 'source']
+
+ISO_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def parse_date(value):
+	if not ISO_DATE_PATTERN.fullmatch(value):
+		value = normalize_date(value)
+		if value is None:
+			return None
+		value = value[:10]
+
+	try:
+		datetime.strptime(value, '%Y-%m-%d')
+	except ValueError:
+		return None
+	return value
+
+
+def next_day(date):
+	return (datetime.strptime(date[:10], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+class ResultIndex:
+
+	def __init__(self, filename):
+		if not os.path.exists(filename):
+			raise sqlite3.OperationalError(f'no such file: {filename}')
+
+		self._db = sqlite3.connect(filename)
+		columns = [row[1] for row in self._db.execute('PRAGMA table_info(reports)')]
+		columns += [row[1] for row in self._db.execute('PRAGMA table_info(results)')]
+		if 'sample_date' not in columns or 'qualifier' not in columns:
+			self._db.close()
+			raise sqlite3.DatabaseError('not a labtool index, or written by an older version (export again with -f sqlite)')
+
+	def query(self, nhc=None, fields=None, since=None, until=None):
+		conditions = []
+		params = []
+
+		if nhc is not None:
+			conditions.append('r.nhc = ?')
+			params.append(nhc)
+
+		if fields:
+			conditions.append(f's.field IN ({", ".join("?" * len(fields))})')
+			params.extend(fields)
+
+		if since is not None:
+			conditions.append('r.sample_date >= ?')
+			params.append(since)
+
+		# Dates may carry a time of day, so the upper bound is the start of the next day
+		if until is not None:
+			conditions.append('r.sample_date < ?')
+			params.append(next_day(until))
+
+		where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+		return self._db.execute(f'''
+			SELECT r.sample_date, r.nhc, s.field, s.value, s.qualifier, s.unit, r.source
+			FROM reports r JOIN results s ON s.report_id = r.id
+			{where}
+			ORDER BY r.nhc, r.sample_date, s.field, r.id
+		''', params)
+
+	def close(self):
+		self._db.close()
@@ -0,0 +1,241 @@
+import json, os, socketserver, stat, threading, time
+
+from collections       import Counter
+from http.server       import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io                import StringIO
+from urllib.parse      import parse_qs, urlparse
+
+from labtool.batch     import WorkerKilled, add_source, parse_content_worker, read_file
+from labtool.encoders  import encoder_requires_filename, get_encoder, open_sink
+from labtool.isolation import IsolatedExecutor
+from labtool.parse     import layout_params
+from labtool.profiling import LatencyRecorder
+
+
+# Larger bodies are refused before any of them is read
+DEFAULT_MAX_BODY = 64 * 2**20
+
+
+def warm_up(engine):
+	layout_params(engine)
+	return os.getpid()
+
+
+class ParseService:
+
+	def __init__(self, jobs=0, cache=None, timeout=None, max_memory=None, **options):
+		self.workers = jobs or os.cpu_count() or 1
+		self.latency = LatencyRecorder()
+		self.counters = Counter()
+		self.started = time.time()
+		# Workers that crash or hit a limit are replaced, so one bad report cannot break the server
+		self._executor = IsolatedExecutor(self.workers, timeout, max_memory)
+		self._cache = cache
+		self._lock = threading.Lock()
+		self._options = options
+
+	def start(self):
+		# Workers are forked and import pdfminer before the first request arrives
+		engine = self._options.get('engine', 'default')
+		pids = {f.result() for f in [self._executor.submit(warm_up, engine) for _ in range(self.workers)]}
+		return len(pids)
+
+	def count(self, name):
+		with self._lock:
+			self.counters[name] += 1
+
+	def parse(self, content, source=None):
+		data = None
+		if self._cache is not None:
+			with self._lock:
+				data = self._cache.get(content)
+
+		if data is None:
+			data, _, _ = self._executor.submit(parse_content_worker, content, False, **self._options).result()
+			if self._cache is not None:
+				with self._lock:
+					# Requests come one at a time, so results are shared with other processes right away
+					self._cache.put(content, data)
+					self._cache.commit()
+
+		return add_source(data, source)
+
+	def metrics(self):
+		with self._lock:
+			metrics = {
+				'uptime': time.time() - self.started,
+				'workers': self.workers,
+				'requests': dict(self.counters),
+				'latency': self.latency.as_dict(),
+			}
+			if self._cache is not None:
+				metrics['cache'] = {'hits': self._cache.hits, 'misses': self._cache.misses, 'errors': self._cache.errors}
+		return metrics
+
+	def close(self):
+		self._executor.shutdown()
+		if self._cache is not None:
+			self._cache.close()
+
+
+def encode_records(format, records):
+	out = StringIO()
+	with open_sink(format, out) as sink:
+		for data in records:
+			sink.write(data)
+	return out.getvalue()
+
+
+class ParseRequestHandler(BaseHTTPRequestHandler):
+
+	server_version = 'labtool'
+	protocol_version = 'HTTP/1.1'
+
+	def address_string(self):
+		# Unix socket peers have no address
+		return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+	def log_message(self, format, *args):
+		if self.server.verbose:
+			super().log_message(format, *args)
+
+	def _send(self, code, body, content_type):
+		body = body.encode('utf-8')
+		self.send_response(code)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def _send_json(self, code, data):
+		self._send(code, json.dumps(data, sort_keys=True), 'application/json')
+
+	def _send_error(self, code, message):
+		self._send_json(code, {'error': message})
+
+	def _reject(self, code, message):
+		self.server.service.count('rejected')
+		self._send_error(code, message)
+
+	def _local_path(self, path):
+		# Over TCP anyone who can connect could read any file, so paths must lie within the root
+		root = self.server.root
+		if root is None:
+			return path if self.server.socket_path is not None else None
+
+		path = os.path.realpath(os.path.join(root, path))
+		return path if os.path.commonpath([root, path]) == root else None
+
+	def _parse(self, query, read_content, source):
+		start = time.perf_counter()
+		try:
+			self._respond_parsed(query, read_content, source)
+		finally:
+			self.server.service.latency.record(time.perf_counter() - start)
+
+	def _respond_parsed(self, query, read_content, source):
+		service = self.server.service
+
+		format = query.get('format', ['jsonl'])[0]
+		if get_encoder(format) is None or encoder_requires_filename(format):
+			self._reject(400, f'unsupported format "{format}"')
+			return
+
+		try:
+			content = read_content()
+		except OSError as e:
+			service.count('not_found')
+			self._send_error(404, f'cannot read "{source}": {e.strerror}')
+			return
+
+		try:
+			data = service.parse(content, source)
+		except WorkerKilled as e:
+			service.count('killed')
+			self._send_error(422, f'cannot parse report: {e}')
+			return
+		except Exception as e:
+			service.count('failed')
+			self._send_error(422, f'cannot parse report: {e}')
+			return
+
+		service.count('parsed')
+		content_type = 'application/json' if format.startswith('json') else 'text/plain; charset=utf-8'
+		self._send(200, encode_records(format, [data]), content_type)
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		query = parse_qs(url.query)
+
+		if url.path == '/metrics':
+			self._send_json(200, self.server.service.metrics())
+		elif url.path == '/parse' and 'path' in query:
+			path = self._local_path(query['path'][0])
+			if path is None and self.server.root is None:
+				self._reject(403, 'reading reports by path is disabled on this server')
+				return
+			if path is None:
+				self._reject(403, f'cannot read "{query["path"][0]}": outside the served root')
+				return
+			self._parse(query, lambda: read_file(path), path)
+		elif url.path == '/parse':
+			self._send_error(400, 'missing path parameter')
+		else:
+			self._send_error(404, 'not found')
+
+	def do_POST(self):
+		url = urlparse(self.path)
+		if url.path != '/parse':
+			self._send_error(404, 'not found')
+			return
+
+		# The body is left unread on errors, so the connection cannot be reused
+		length = self.headers.get('Content-Length')
+		if length is None:
+			self.close_connection = True
+			self._reject(411, 'missing Content-Length')
+			return
+
+		try:
+			length = int(length)
+		except ValueError:
+			length = -1
+
+		if length < 0:
+			self.close_connection = True
+			self._reject(400, f'invalid Content-Length "{self.headers["Content-Length"]}"')
+			return
+
+		if length > self.server.max_body:
+			self.close_connection = True
+			self._reject(413, f'report larger than {self.server.max_body} bytes')
+			return
+
+		body = self.rfile.read(length)
+		self._parse(parse_qs(url.query), lambda: body, None)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+	daemon_threads = True
+
+	def server_close(self):
+		super().server_close()
+		os.unlink(self.server_address)
+
+
+def make_server(service, host='127.0.0.1', port=8765, socket_path=None, verbose=False, root=None, max_body=DEFAULT_MAX_BODY):
+	if socket_path is not None:
+		# A socket left behind by a previous run would make bind fail
+		if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+			os.unlink(socket_path)
+		server = UnixHTTPServer(socket_path, ParseRequestHandler)
+	else:
+		server = ThreadingHTTPServer((host, port), ParseRequestHandler)
+
+	server.service = service
+	server.verbose = verbose
+	server.socket_path = socket_path
+	server.root = os.path.realpath(root) if root is not None else None
+	server.max_body = max_body
+	return server
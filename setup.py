@@ -18,7 +18,10 @@ setuptools.setup(
 		"Operating System :: OS Independent",
 		"License :: OSI Approved :: GNU General Public License v3 (GPLv3)"
 	],
-	python_requires='>=3.6',
+	python_requires='>=3.7',
+	extras_require={
+		"analysis": ["numpy"],
+	},
 	entry_points={
 		"console_scripts": [
 			"labtool = labtool.__main__:main"
@@ -0,0 +1,4 @@
+import os, sys
+
+# Tests use the report generator in benchmarks/, which is not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,16 @@
+import pytest
+
+from labtool       import parse
+from labtool.cache import parser_fingerprint
+
+
+@pytest.mark.parametrize('table, change', [
+	('FIELD_PREFIXES', lambda t: t + ['Orina']),
+	('CHARACTER_FOLDING', lambda t: {**t, ord('ñ'): 'n'}),
+	('STANDALONE_FIELDS', lambda t: t + ['Hora']),
+	('FIELD_MAPPING', lambda t: {**t, 'Srm-Nou;c.subst.': 'Serum/Nou'}),
+])
+def test_fingerprint_follows_parser_tables(monkeypatch, table, change):
+	before = parser_fingerprint()
+	monkeypatch.setattr(parse, table, change(getattr(parse, table)))
+	assert parser_fingerprint() != before
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from labtool.parse import (FIELD_MAPPING, FIELD_PREFIXES, LINE_REGULAR, LINE_STANDALONE, LINE_VALUE, REGULAR_FIELD_KEYS,
+                           STANDALONE_FIELDS, apply_field_mapping, classify_line)
+
+
+# Lines were classified by testing each label in turn before the compiled pattern
+def reference_classify_line(content):
+	for m in STANDALONE_FIELDS:
+		if content.startswith(f'{m}:'):
+			return LINE_STANDALONE, m
+
+	for m in FIELD_PREFIXES:
+		if content.startswith(f'{m}-'):
+			return LINE_REGULAR, m
+
+	return LINE_VALUE, None
+
+
+def longest_key(content):
+	return max((k for k in REGULAR_FIELD_KEYS if content.startswith(k)), key=len, default=None)
+
+
+TRICKY_LINES = [
+	'',
+	'-',
+	'Pla',
+	'Pla-',
+	'vPla-Glucosa;c.subst.',
+	'Sang-Hemoglobina',
+	'San-',
+	'Hb(San)-',
+	'Hb(vSan)-Hemoglobina',
+	'Gas(vSan)-pH;',
+	'NHC',
+	'NHC:',
+	'NHC: 123456',
+	'Data obtencio mostra: 01/02/2023 10:00',
+	'Data obtencio mostra 01/02/2023',
+	'Pacient: DOE, JOHN',
+	'Observacions: Pla-Glucosa',
+	'Pla-Coagulacio induida per factor tissular;INR(temps de',
+	'Pla-Coagulacio induida per factor tissular;INR(temps de protrombina)',
+	'Pla-Coagulacio induida per factor tissular;temps rel.(temps de protrombina)',
+	'Pla-Coagulacio induida per factor tissular;',
+	'12.5',
+	'<5',
+	'Pendent',
+	'mg/dL',
+]
+
+
+def sample_lines(seed, count=500):
+	rng = random.Random(seed)
+	templates = (list(FIELD_MAPPING) + [f'{f}: Valor' for f in STANDALONE_FIELDS] + [f'{p}-' for p in FIELD_PREFIXES]
+	             + TRICKY_LINES)
+	lines = []
+	for _ in range(count):
+		line = rng.choice(templates)
+		cut = rng.randint(0, len(line))
+		# Lines are wrapped anywhere, and continued with text that may not be a known name
+		lines.append(rng.choice([line, line[:cut], line + rng.choice([' de', 'de protrombina)', ':', '-', ' 5.0'])]))
+	return lines
+
+
+@pytest.mark.parametrize('line', TRICKY_LINES)
+def test_tricky_lines_classified_as_before(line):
+	kind, prefix, _ = classify_line(line)
+	assert (kind, prefix) == reference_classify_line(line)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_classify_matches_reference(seed):
+	for line in sample_lines(seed):
+		kind, prefix, key = classify_line(line)
+		assert (kind, prefix) == reference_classify_line(line), line
+
+		if kind == LINE_REGULAR:
+			assert key == longest_key(line), line
+		elif kind == LINE_STANDALONE:
+			assert key == (prefix if prefix in FIELD_MAPPING else None), line
+		else:
+			assert key is None, line
+
+
+@pytest.mark.parametrize('key', sorted(FIELD_MAPPING))
+def test_known_names_mapped(key):
+	assert apply_field_mapping(key) == FIELD_MAPPING[key]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_wrapped_names_mapped_by_longest_prefix(seed):
+	for line in sample_lines(seed):
+		key = longest_key(line)
+		expected = FIELD_MAPPING.get(line, FIELD_MAPPING[key] if key is not None else line)
+		assert apply_field_mapping(line) == expected, line
+
+
+def test_wrapped_inr_name():
+	# Used to need its own FIELD_MAPPING entry, next to the one it is wrapped from
+	for name in ['Pla-Coagulacio induida per factor tissular;INR(temps de',
+	             'Pla-Coagulacio induida per factor tissular;INR(temps de protrombina)']:
+		assert apply_field_mapping(name) == 'Plasma/INR'
+
+	assert apply_field_mapping('Pla-Coagulacio induida per factor tissular;temps rel.(temps de') == 'Plasma/TP'
+	assert apply_field_mapping('Pla-Coagulacio induida per factor tissular;') == 'Pla-Coagulacio induida per factor tissular;'
@@ -0,0 +1,33 @@
+from io                   import BytesIO, StringIO
+
+import pytest
+
+from benchmarks.generate  import make_report
+from labtool.encoders     import open_sink
+from labtool.encoders.csv import StreamingCSVEncoder
+from labtool.parse        import STANDALONE_FIELDS, apply_field_mapping, parse_lab
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_default_columns_cover_parsed_fields(seed):
+	warnings = []
+	with open_sink('csv-stream', StringIO(), warn=warnings.append) as sink:
+		sink.write(parse_lab(BytesIO(make_report(seed, pages=2, fields=30, comments=1))))
+	assert warnings == []
+
+
+def test_default_columns_include_unmapped_standalone_fields():
+	assert 'Data recepcio mostra' in StreamingCSVEncoder.DEFAULT_COLUMNS
+	assert {apply_field_mapping(f) for f in STANDALONE_FIELDS} <= set(StreamingCSVEncoder.DEFAULT_COLUMNS)
+
+
+def test_fields_outside_columns_warned_once():
+	warnings = []
+	encoder = StreamingCSVEncoder(StringIO(), columns=['Serum/Glucosa'], warn=warnings.append)
+	encoder.begin()
+	for _ in range(2):
+		encoder.begin_record()
+		encoder.write_property('Serum/Glucosa', 'value', 5.0)
+		encoder.write_property('Serum/Urea', 'value', 30.0)
+		encoder.end_record()
+	assert warnings == ['Column "Serum/Urea" is not in the output, leaving it out']
@@ -0,0 +1,17 @@
+from io                  import BytesIO
+
+import pytest
+
+from benchmarks.generate import make_report
+from labtool.parse       import EXTRACTION_ENGINES, parse_lab
+
+
+def describe_fields(data):
+	return sorted((field.name, repr(field._data)) for field in data)
+
+
+@pytest.mark.parametrize('engine', [e for e in EXTRACTION_ENGINES if e != 'default'])
+@pytest.mark.parametrize('seed', range(4))
+def test_engine_matches_default(engine, seed):
+	report = make_report(seed, pages=2, fields=30, comments=1)
+	assert describe_fields(parse_lab(BytesIO(report), engine)) == describe_fields(parse_lab(BytesIO(report)))
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from labtool.parse import ITEM_VTOLERANCY, POSITION_TOP, ValueItemIndex, find_field_related_items, item_ordering
+
+
+# Scans every remaining item, as field values were looked up before the index
+def linear_related_items(limits, available):
+	related = []
+	left, bottom, _, top = limits
+	for content, pos in available:
+		if pos == limits:
+			continue
+
+		ileft, _, _, itop = pos
+		if ileft < left or bottom - itop > ITEM_VTOLERANCY or itop - top > ITEM_VTOLERANCY:
+			continue
+
+		related.append((content, pos))
+	return related
+
+
+def random_coordinate(rng):
+	# Round values make ties and items exactly on the tolerance bounds likely
+	return rng.choice([rng.uniform(0, 800), rng.randint(0, 80) * ITEM_VTOLERANCY])
+
+
+def random_position(rng):
+	left, top = random_coordinate(rng), random_coordinate(rng)
+	return [left, top - rng.choice([0, 5, 10, rng.uniform(0, 40)]), left + 50, top]
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_index_matches_linear_scan(seed):
+	rng = random.Random(seed)
+	items = [(f'item {i}', random_position(rng)) for i in range(rng.randint(0, 60))]
+
+	index = ValueItemIndex(items)
+	remaining = sorted(items, key=lambda c_p: item_ordering(c_p[1]))
+
+	for _ in range(rng.randint(1, 30)):
+		limits = rng.choice(remaining)[1] if remaining and rng.random() < 0.2 else random_position(rng)
+		assert find_field_related_items(limits, index) == linear_related_items(limits, remaining)
+
+		count = rng.randint(0, 4)
+		index.consume(count)
+		remaining = remaining[count:]
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_index_finds_items_within_bounds(seed):
+	rng = random.Random(seed)
+	items = sorted(((f'item {i}', random_position(rng)) for i in range(rng.randint(0, 60))), key=lambda c_p: item_ordering(c_p[1]))
+
+	index = ValueItemIndex(items)
+	for _ in range(10):
+		low, high = sorted([random_coordinate(rng), random_coordinate(rng)])
+		assert index.find(low, high) == [(c, pos) for c, pos in items if low <= pos[POSITION_TOP] <= high]
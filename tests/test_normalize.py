@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from benchmarks.normalize import make_lines, reference_normalize_string
+from labtool.parse        import normalize_string
+
+
+TRICKY_LINES = [
+	'',
+	'   ',
+	' \t Pla-Glucosa;c.subst. \t ',
+	'Pla-Coagulacio induida per factor tissular ; INR (temps de',
+	'Srm-Colesterol  ;  c.subst.',
+	'San-Hemoglobina ;c.massa',
+	'a . b ; c ) d',
+	'a  ;(b',
+	'x ) ;( y',
+	'" ; "',
+	'\'-\'',
+	'"(San)"-"Hb"',
+	'San-"Leucocits";\'c.nomb.\'',
+	'; ; ;',
+	'. . .',
+	') ) )',
+	'( ( (',
+	'Data recepció mostra: 01/02/2023',
+	'Unitat de tractament: Hematologia — Planta 3',
+	'Procedència: Urgències',
+	'Anàlisi ´especial` de sèrum',
+	'Sodi; ïó òú',
+]
+
+
+@pytest.mark.parametrize('line', TRICKY_LINES)
+def test_tricky_lines_normalized_as_before(line):
+	assert normalize_string(line) == reference_normalize_string(line)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_strings_normalized_as_before(seed):
+	rng = random.Random(seed)
+	# Runs of the characters the substitutions look at, where their matches can overlap
+	alphabet = ' \t;().-\'"`´—àúèéíïòóaZ0'
+	for _ in range(1000):
+		line = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+		assert normalize_string(line) == reference_normalize_string(line), repr(line)
+
+
+def test_label_lines_normalized_as_before():
+	for line in make_lines(2000):
+		assert normalize_string(line) == reference_normalize_string(line), line
@@ -0,0 +1,21 @@
+import pytest
+
+from labtool.encoders.tab import format_value
+from labtool.parse        import try_parse_field_value
+
+
+@pytest.mark.parametrize('content, shown', [
+	('89.0', '89.0'),
+	('7.40', '7.40'),
+	('* 12', '12'),
+	('<5', '<5'),
+	('>100.0', '>100.0'),
+])
+def test_values_shown_as_printed(content, shown):
+	number = try_parse_field_value(content)
+	assert format_value(number.value, number.qualifier, number.text) == shown
+
+
+def test_values_without_text_keep_precision():
+	assert format_value(7.4, '=') == '7.4'
+	assert format_value(0.1 + 0.2, '<') == '<0.3'